@@ -0,0 +1,117 @@
+import os
+
+OUTPUT_FORMATS = ('text', 'json', 'ndjson')
+# Output collected before one write to the stream
+OUTPUT_BUFFER_SIZE = 1024 * 1024
+
+class OutputWriter:
+    # Write command results as text lines, a JSON array or NDJSON through a large buffer.
+    # The first `offset` results are skipped and writing stops after `limit` results,
+    # write returns False from then on so commands can stop producing results early.
+    def __init__(self, stream, output_format='text', limit=None, offset=0, buffer_size=OUTPUT_BUFFER_SIZE):
+        # Parameters: stream (file): Text stream the output is written to (e.g. sys.stdout),
+        # output_format (str): 'text', 'json' or 'ndjson', limit (int): Maximum number of results, None for all,
+        # offset (int): Number of results skipped, buffer_size (int): Output collected before writing it.
+        if output_format not in OUTPUT_FORMATS:
+            raise ValueError(f"output format must be one of {', '.join(OUTPUT_FORMATS)}, not '{output_format}'")
+        if (limit is not None and limit < 0) or offset < 0:
+            raise ValueError('limit and offset must not be negative')
+        if output_format != 'text':
+            import json
+
+            self._dumps = json.dumps
+        self.stream = stream
+        self.output_format = output_format
+        self.limit = limit
+        self.offset = offset
+        self.buffer_size = buffer_size
+        # Results written and skipped, errors are not counted
+        self.written = 0
+        self.skipped = 0
+        self._items = 0
+        # Set when the stream is closed (e.g. the reading end of a pipe exits)
+        self.closed = False
+        self._buffer = []
+        self._buffered = 0
+
+    @property
+    def done(self):
+        # Returns: done (bool): No more results are written.
+        return self.closed or (self.limit is not None and self.written >= self.limit)
+
+    def write(self, text, record=None, encoded=None):
+        # Write one command result.
+        # Parameters: text (str): The result as text (may span lines),
+        # record (dict): The result for JSON formats, {'message': text} by default,
+        # encoded (str): The result already encoded as JSON, used instead of record.
+        # Returns: more (bool): False once the limit is reached or the stream is closed.
+        if self.done:
+            return False
+        if self.skipped < self.offset:
+            self.skipped += 1
+            return True
+
+        self._append(text, record, encoded)
+        self.written += 1
+        return not self.done
+
+    def write_error(self, text):
+        # Write an error message (failed authentication, missing permission),
+        # it is never skipped by offset nor stopped by limit.
+        # Parameters: text (str): The error message.
+        # Returns: None
+        if not self.closed:
+            self._append(text, {'error': text}, None)
+
+    def _append(self, text, record, encoded):
+        # Format one result and add it to the buffer.
+        # Returns: None
+        if self.output_format == 'text':
+            chunk = text + '\n'
+        else:
+            if encoded is None:
+                encoded = self._dumps(record if record is not None else {'message': text})
+            if self.output_format == 'ndjson':
+                chunk = encoded + '\n'
+            else:
+                chunk = ('[\n' if self._items == 0 else ',\n') + encoded
+        self._items += 1
+
+        self._buffer.append(chunk)
+        self._buffered += len(chunk)
+        if self._buffered >= self.buffer_size:
+            self.flush()
+
+    def flush(self):
+        # Write the buffered output to the stream.
+        # Returns: None
+        if self._buffer and not self.closed:
+            output = ''.join(self._buffer)
+            try:
+                self.stream.write(output)
+                self.stream.flush()
+            except BrokenPipeError:
+                self._close_stream()
+        self._buffer = []
+        self._buffered = 0
+
+    def close(self):
+        # Finish the JSON array and write the rest of the output.
+        # Returns: None
+        if self.output_format == 'json' and not self.closed:
+            self._buffer.append('\n]\n' if self._items else '[]\n')
+        self.flush()
+        # Nothing is written after closing, even when the writer is closed again
+        self.closed = True
+
+    def _close_stream(self):
+        # Stop writing after the reader of the stream went away. The stream file descriptor
+        # is pointed at /dev/null, so flushing it at exit does not fail again.
+        # Returns: None
+        self.closed = True
+        try:
+            devnull = os.open(os.devnull, os.O_WRONLY)
+            os.dup2(devnull, self.stream.fileno())
+            os.close(devnull)
+        except (AttributeError, OSError, ValueError):
+            pass
@@ -0,0 +1,214 @@
+import sqlite3
+from itertools import groupby, islice
+from UserDataProcessor import UserDataProcessor, User, CREATE_INDEX_QUERIES, format_created_at
+
+# Queries of SQLiteUserDataProcessor and ShardedSQLiteUserDataProcessor. Rows are sorted,
+# so rows of database shards can be merged in the same order
+USER_QUERY = '''SELECT id, firstname, telephone_number, email, password, role, created_at
+                FROM users WHERE telephone_number = ? OR email = ? ORDER BY id LIMIT 1'''
+CHILDREN_QUERY = 'SELECT id, name, age FROM children WHERE parent_email = ? ORDER BY id'
+COUNT_USERS_QUERY = 'SELECT COUNT(*) FROM users'
+# created_at text sorts chronologically, the first user wins a tie
+OLDEST_ACCOUNTS_QUERY = '''SELECT created_at, id, firstname, email FROM users WHERE created_at IS NOT NULL
+                           ORDER BY created_at, id LIMIT ?'''
+NEWEST_ACCOUNTS_QUERY = '''SELECT created_at, id, firstname, email FROM users WHERE created_at IS NOT NULL
+                           ORDER BY created_at DESC, id DESC LIMIT ?'''
+ACCOUNTS_CREATED_QUERY = 'SELECT created_at, id, firstname, email FROM users {condition} ORDER BY created_at, id'
+SIGNUP_COUNTS_QUERY = '''SELECT substr(created_at, 1, {length}) AS period, COUNT(*) FROM users {condition}
+                         GROUP BY period ORDER BY period'''
+MAX_CHILD_ID_QUERY = 'SELECT COALESCE(MAX(id), 0) + 1 FROM children'
+# Count of every age and the position of its first child in the loaded data
+# (users by id, then their children by id)
+AGE_COUNTS_QUERY = '''SELECT c.age, COUNT(*), MIN(u.id * ? + c.id)
+                      FROM children c JOIN users u ON u.email = c.parent_email
+                      GROUP BY c.age'''
+# Users with children of the given ages, their children sorted alphabetically
+SIMILAR_CHILDREN_QUERY = '''SELECT u.id, u.firstname, u.telephone_number, c.name, c.age
+                            FROM users u JOIN children c ON c.parent_email = u.email
+                            WHERE u.id IN (SELECT u2.id FROM children c2
+                                           JOIN users u2 ON u2.email = c2.parent_email
+                                           WHERE c2.age IN ({placeholders}))
+                            ORDER BY u.id, c.name, c.id'''
+PARENTS_CHILDREN_AGES_QUERY = '''SELECT DISTINCT u.id, u.firstname, u.telephone_number, u.email, c.age
+                                 FROM users u JOIN children c ON c.parent_email = u.email
+                                 ORDER BY u.id, c.age'''
+
+def created_at_window(since, until):
+    # Build the SQL condition of a created_at time window, created_at text sorts chronologically.
+    # Parameters: since (int), until (int): Epochs of the time window (until excluded), None for no bound.
+    # Returns: condition (str): WHERE clause, parameters (tuple): Its parameters.
+    conditions = ['created_at IS NOT NULL']
+    parameters = []
+    if since is not None:
+        conditions.append('created_at >= ?')
+        parameters.append(format_created_at(since))
+    if until is not None:
+        conditions.append('created_at < ?')
+        parameters.append(format_created_at(until))
+    return 'WHERE ' + ' AND '.join(conditions), tuple(parameters)
+
+class SQLiteUserDataProcessor(UserDataProcessor):
+    # Answer commands with SQL queries against a SQLite database
+    # (created by `create_database`) without loading users data into memory.
+    # Results are the same as after loading the database with import_data.
+    def __init__(self, database_file):
+        super().__init__()
+        self.conn = sqlite3.connect(database_file)
+
+        # Indexes used by the queries, created if the database is writable
+        try:
+            for create_index_query in CREATE_INDEX_QUERIES:
+                self.conn.execute(create_index_query)
+            self.conn.commit()
+        except sqlite3.OperationalError as e:
+            print(f'Error creating database indexes: {e}')
+
+    def close(self):
+        # Close the database connection.
+        # Returns: None
+        self.conn.close()
+
+    def _rows(self, query, parameters=(), key=None, reverse=False):
+        # Run a query which sorts its rows.
+        # Parameters: query (str): SQL query, parameters (tuple): Query parameters,
+        # key (function), reverse (bool): Sort order of the rows, used to merge rows of database shards.
+        # Returns: rows (iterator): Result rows.
+        return self.conn.execute(query, parameters)
+
+    def _count_users(self):
+        # Returns: count (int): Number of users.
+        return self.conn.execute(COUNT_USERS_QUERY).fetchone()[0]
+
+    def _query_age_counts(self):
+        # Returns: age_counts (list): (age, count, position of the first child in the loaded data) of every age.
+        max_child_id = self.conn.execute(MAX_CHILD_ID_QUERY).fetchone()[0]
+        return self.conn.execute(AGE_COUNTS_QUERY, (max_child_id,)).fetchall()
+
+    def authenticate_user(self, login, password):
+        # Authenticate a user based on login (telephone number or email) and password.
+        # Parameters: login (str): telephone number or email, password (str).
+        # Returns: user (User): The authenticated user's data if successful / str: Error message if authentication fails.
+        # The first user with this login wins
+        row = next(iter(self._rows(USER_QUERY, (login, login))), None)
+
+        if row is not None:
+            if row[4] == password:
+                children = [child[1:] for child in self._rows(CHILDREN_QUERY, (row[3],))]
+                return User.from_row(*row[1:], children)
+            else:
+                return 'Your password is wrong. Try with double quotes around your password'
+        return 'Your login is wrong'
+
+    def print_all_accounts(self, login, password):
+        # Print the total number of accounts if the user is authenticated as an admin.
+        # Parameters: login (str): telephone number or email, password (str).
+        # Returns: None
+        auth_result = self.authenticate_user(login, password)
+
+        if isinstance(auth_result, User):
+            if auth_result.role == 'admin':
+                accounts = self._count_users()
+                self._write(str(accounts), {'accounts': accounts})
+            else:
+                self._write_error(f'You need admin permission, but your role is: {auth_result.role}')
+        else:
+            self._write_error(auth_result)
+
+    def print_oldest_account(self, login, password):
+        # Print information about the oldest account if the user is authenticated as an admin.
+        # Parameters: login (str): telephone number or email, password (str).
+        # Returns: None
+        auth_result = self.authenticate_user(login, password)
+
+        if isinstance(auth_result, User):
+            if auth_result.role == 'admin':
+                # Users without created_at are skipped, as in the loaded data
+                oldest_accounts = self._oldest_accounts(1)
+                if oldest_accounts:
+                    self._write_oldest_account(*oldest_accounts[0])
+                else:
+                    self._write('No accounts with a creation date.')
+            else:
+                self._write_error(f'You need admin permission, but your role is: {auth_result.role}')
+        else:
+            self._write_error(auth_result)
+
+    def _oldest_accounts(self, count):
+        # Parameters: count (int): Number of accounts.
+        # Returns: accounts (list): (firstname, email, created_at) of the oldest accounts, oldest first.
+        count = max(count, 0)
+        rows = islice(self._rows(OLDEST_ACCOUNTS_QUERY, (count,)), count)
+        return [(firstname, email, created_at) for created_at, user_id, firstname, email in rows]
+
+    def _newest_accounts(self, count):
+        # Parameters: count (int): Number of accounts.
+        # Returns: accounts (list): (firstname, email, created_at) of the newest accounts, newest first.
+        count = max(count, 0)
+        rows = islice(self._rows(NEWEST_ACCOUNTS_QUERY, (count,), reverse=True), count)
+        return [(firstname, email, created_at) for created_at, user_id, firstname, email in rows]
+
+    def _accounts_created_between(self, since, until):
+        # Parameters: since (int), until (int): Epochs of the time window (until excluded), None for no bound.
+        # Returns: accounts (list): (firstname, email, created_at) of accounts created in the window, oldest first.
+        condition, parameters = created_at_window(since, until)
+        rows = self._rows(ACCOUNTS_CREATED_QUERY.format(condition=condition), parameters)
+        return [(firstname, email, created_at) for created_at, user_id, firstname, email in rows]
+
+    def _signup_counts(self, period, since, until):
+        # Parameters: period (str): 'day' or 'month',
+        # since (int), until (int): Epochs of the time window (until excluded), None for no bound.
+        # Returns: counts (list): (period label, number of accounts created in it), in chronological order.
+        condition, parameters = created_at_window(since, until)
+        counts_query = SIGNUP_COUNTS_QUERY.format(length=10 if period == 'day' else 7, condition=condition)
+        return self.conn.execute(counts_query, parameters).fetchall()
+
+    def _parents_children_ages(self):
+        # Returns: parents (list): (firstname, telephone_number, email, ages) of users with children
+        # in users data order, ages of their children sorted without repeats.
+        rows = self._rows(PARENTS_CHILDREN_AGES_QUERY, key=lambda row: row[0])
+        return [(firstname, telephone_number, email, [row[4] for row in parent_rows])
+                for (user_id, firstname, telephone_number, email), parent_rows
+                in groupby(rows, key=lambda row: row[:4])]
+
+    def group_by_age(self, login, password):
+        # Group users children by age and print the count of children for each age if the user is authenticated as an admin.
+        # Parameters: login (str): telephone number or email, password (str).
+        # Returns: None
+        auth_result = self.authenticate_user(login, password)
+
+        if isinstance(auth_result, User):
+            if auth_result.role == 'admin':
+                # Ages with the same count keep the order in which they first appear in the loaded data
+                for age, count, first in sorted(self._query_age_counts(), key=lambda age_count: age_count[1:]):
+                    if not self._write_age_count(age, count):
+                        break
+            else:
+                self._write_error(f'You need admin permission, but your role is: {auth_result.role}')
+        else:
+            self._write_error(auth_result)
+
+    def find_similar_children_by_age(self, login, password):
+        # Find and print users with similar children by age for the authenticated user.
+        # Parameters: login (str): telephone number or email, password (str).
+        # Returns: None
+        auth_result = self.authenticate_user(login, password)
+        if isinstance(auth_result, User):
+            children_age = sorted({child.age for child in auth_result.children})
+
+            if children_age:
+                similar_query = SIMILAR_CHILDREN_QUERY.format(placeholders=', '.join('?' * len(children_age)))
+                rows = self._rows(similar_query, children_age, key=lambda row: row[0])
+                for (user_id, firstname, telephone_number), user_rows in groupby(rows, key=lambda row: row[:3]):
+                    if not self._write_similar_user(firstname, telephone_number, [row[3:5] for row in user_rows]):
+                        break
+
+            else:
+                self._write('No children data available for the authenticated user.')
+
+        else:
+            self._write_error(auth_result)
+
+    def create_database(self, login, password, sync=False, database_file='users_database.db', shards=1):
+        # The database is already the source of users data.
+        # Returns: None
+        self._write_error('create_database is not available when querying the database directly.')
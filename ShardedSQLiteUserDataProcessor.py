@@ -0,0 +1,70 @@
+import heapq
+from collections import Counter
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+from UserDataProcessor import UserDataProcessor, shard_files
+from SQLiteUserDataProcessor import (SQLiteUserDataProcessor, COUNT_USERS_QUERY, MAX_CHILD_ID_QUERY,
+                                     AGE_COUNTS_QUERY, SIGNUP_COUNTS_QUERY, created_at_window)
+
+class ShardedSQLiteUserDataProcessor(SQLiteUserDataProcessor):
+    # Answer commands with SQL queries scattered to the shards of a sharded database
+    # (created by `create_database` with shards), merging the partial results.
+    # Results are the same as after loading the database with import_sharded_database.
+    def __init__(self, directory):
+        # Parameters: directory (str): The path to the sharded database folder.
+        UserDataProcessor.__init__(self)
+        files = shard_files(directory)
+        if not files:
+            raise FileNotFoundError(f'No database shards in {directory}')
+        # Every connection is used by one thread at a time
+        self.conns = [sqlite3.connect(file, check_same_thread=False) for file in files]
+        self._executor = ThreadPoolExecutor(max_workers=len(self.conns))
+
+    def close(self):
+        # Close the shard connections.
+        # Returns: None
+        self._executor.shutdown()
+        for conn in self.conns:
+            conn.close()
+
+    def _scatter(self, query, parameters=()):
+        # Run a query on every shard in parallel, SQLite releases the GIL while it runs.
+        # Parameters: query (str): SQL query, parameters (tuple): Query parameters.
+        # Returns: results (list): Rows of every shard.
+        return list(self._executor.map(lambda conn: conn.execute(query, parameters).fetchall(), self.conns))
+
+    def _rows(self, query, parameters=(), key=None, reverse=False):
+        # Run a query which sorts its rows on every shard and merge the rows in the same order.
+        # Ids are numbered across shards and a user and its children are in one shard.
+        # Parameters: query (str): SQL query, parameters (tuple): Query parameters,
+        # key (function), reverse (bool): Sort order of the rows.
+        # Returns: rows (iterator): Result rows.
+        return heapq.merge(*self._scatter(query, parameters), key=key, reverse=reverse)
+
+    def _count_users(self):
+        # Returns: count (int): Number of users.
+        return sum(rows[0][0] for rows in self._scatter(COUNT_USERS_QUERY))
+
+    def _query_age_counts(self):
+        # Returns: age_counts (list): (age, count, position of the first child in the loaded data) of every age.
+        max_child_id = max(rows[0][0] for rows in self._scatter(MAX_CHILD_ID_QUERY))
+        ages = {}
+        for rows in self._scatter(AGE_COUNTS_QUERY, (max_child_id,)):
+            for age, count, first in rows:
+                if age in ages:
+                    previous_count, previous_first = ages[age]
+                    ages[age] = (previous_count + count, min(previous_first, first))
+                else:
+                    ages[age] = (count, first)
+        return [(age, count, first) for age, (count, first) in ages.items()]
+
+    def _signup_counts(self, period, since, until):
+        # Parameters: period (str): 'day' or 'month',
+        # since (int), until (int): Epochs of the time window (until excluded), None for no bound.
+        # Returns: counts (list): (period label, number of accounts created in it), in chronological order.
+        condition, parameters = created_at_window(since, until)
+        counts_query = SIGNUP_COUNTS_QUERY.format(length=10 if period == 'day' else 7, condition=condition)
+        counts = Counter()
+        for rows in self._scatter(counts_query, parameters):
+            counts.update(dict(rows))
+        return sorted(counts.items())
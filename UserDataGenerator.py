@@ -0,0 +1,216 @@
+import os
+import json
+import csv
+import random
+import sqlite3
+from datetime import datetime, timedelta
+from xml.sax.saxutils import escape
+
+FIRSTNAMES = ['Justin', 'Patricia', 'Hannah', 'Don', 'Arthur', 'Brandy', 'Jeff', 'Tim',
+              'Sarah', 'Michael', 'Theresa', 'Judith', 'Teresa', 'Christopher', 'Madison', 'Tamara']
+
+PASSWORD_CHARACTERS = 'abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789!#$%&()*+-_'
+
+# Login of the admin generated as the first user of every dataset
+ADMIN_LOGIN = 'admin@example.com'
+ADMIN_PASSWORD = 'Admin#2023'
+
+# Rows written to SQLite per executemany call
+DB_BATCH_SIZE = 10000
+
+class UserDataGenerator:
+    # Generate synthetic users data in the JSON, CSV, XML and SQLite formats read by UserDataProcessor.
+    # Users are numbered, user N has email `userN@example.com` and telephone number 100000000 + N,
+    # so duplicates can point at any earlier user without keeping the generated users in memory.
+    def __init__(self, seed=0, duplicate_rate=0.05, invalid_rate=0.05, max_children=3):
+        # Parameters: seed (int): Seed of the random generator,
+        # duplicate_rate (float): Share of users repeating the email or telephone number of an earlier user,
+        # invalid_rate (float): Share of users with a missing or malformed email or telephone number,
+        # max_children (int): Maximum number of children of a user.
+        self.random = random.Random(seed)
+        self.duplicate_rate = duplicate_rate
+        self.invalid_rate = invalid_rate
+        self.max_children = max_children
+        self.generated = 0
+        self.duplicates = 0
+        self.invalid = 0
+        self._start = datetime(2022, 1, 1)
+        self._period = int(timedelta(days=730).total_seconds())
+
+    def generate(self, count):
+        # Generate users, numbering continues across calls so files of one dataset share duplicates.
+        # Parameters: count (int): Number of users.
+        # Returns: users (generator): Rows (firstname, telephone_number, email, password, role, created_at, children).
+        rand = self.random.random
+        for _ in range(count):
+            number = self.generated
+            self.generated += 1
+            if number == 0:
+                yield self._admin()
+                continue
+
+            email = f'user{number}@example.com'
+            telephone_number = str(100000000 + number)
+            chance = rand()
+            if chance < self.invalid_rate:
+                self.invalid += 1
+                email, telephone_number = self._invalidate(email, telephone_number)
+            elif chance < self.invalid_rate + self.duplicate_rate and number > 1:
+                self.duplicates += 1
+                original = self.random.randrange(1, number)
+                if rand() < 0.5:
+                    email = f'user{original}@example.com'
+                else:
+                    telephone_number = str(100000000 + original)
+            telephone_number = self._format_telephone(telephone_number)
+
+            yield (self.random.choice(FIRSTNAMES), telephone_number, email, self._password(),
+                   'admin' if rand() < 0.1 else 'user', self._created_at(), self._children())
+
+    def _admin(self):
+        # Returns: admin (tuple): Row of the admin user, valid and never duplicated.
+        return ('Admin', '100000000', ADMIN_LOGIN, ADMIN_PASSWORD, 'admin',
+                self._created_at(), self._children())
+
+    def _invalidate(self, email, telephone_number):
+        # Break the email or the telephone number of a user.
+        # Returns: email (str), telephone_number (str).
+        kind = self.random.randrange(4)
+        if kind == 0:
+            return '', telephone_number
+        if kind == 1:
+            return email.replace('@', ''), telephone_number
+        if kind == 2:
+            return email.replace('.com', '.company'), telephone_number
+        return email, ''
+
+    def _format_telephone(self, telephone_number):
+        # Spell some telephone numbers with a country code and spaces, as in the real data.
+        # Returns: telephone_number (str).
+        if telephone_number and self.random.random() < 0.2:
+            return f'+48 {telephone_number[:3]} {telephone_number[3:6]} {telephone_number[6:]}'
+        return telephone_number
+
+    def _password(self):
+        return ''.join(self.random.choices(PASSWORD_CHARACTERS, k=10))
+
+    def _created_at(self):
+        created_at = self._start + timedelta(seconds=self.random.randrange(self._period))
+        return created_at.strftime('%Y-%m-%d %H:%M:%S')
+
+    def _children(self):
+        return [(self.random.choice(FIRSTNAMES), self.random.randint(1, 17))
+                for _ in range(self.random.randint(0, self.max_children))]
+
+    def write_file(self, file, count):
+        # Write users to a file, the format is selected by its extension.
+        # Parameters: file (str): The path to the .json, .csv, .xml or .db file, count (int): Number of users.
+        # Returns: None
+        if file.endswith('.json'):
+            self.write_json(file, count)
+        elif file.endswith('.csv'):
+            self.write_csv(file, count)
+        elif file.endswith('.xml'):
+            self.write_xml(file, count)
+        elif file.endswith('.db'):
+            self.write_db(file, count)
+        else:
+            raise ValueError(f'Unsupported data file: {file}')
+
+    def write_json(self, file, count):
+        # Write users to a JSON file, one user at a time.
+        # Parameters: file (str): The path to the JSON file, count (int): Number of users.
+        # Returns: None
+        with open(file, 'w') as data:
+            data.write('[')
+            separator = '\n'
+            for firstname, telephone_number, email, password, role, created_at, children in self.generate(count):
+                user = {
+                    'firstname': firstname,
+                    'telephone_number': telephone_number,
+                    'email': email,
+                    'password': password,
+                    'role': role,
+                    'created_at': created_at,
+                    'children': [{'name': name, 'age': age} for name, age in children]
+                }
+                data.write(separator + json.dumps(user))
+                separator = ',\n'
+            data.write('\n]\n')
+
+    def write_csv(self, file, count):
+        # Write users to a semicolon separated CSV file with children as `Name (age)`.
+        # Parameters: file (str): The path to the CSV file, count (int): Number of users.
+        # Returns: None
+        with open(file, 'w', newline='') as data:
+            csvwriter = csv.writer(data, delimiter=';')
+            csvwriter.writerow(['firstname', 'telephone_number', 'email', 'password', 'role', 'created_at', 'children'])
+            for row in self.generate(count):
+                children = ','.join(f'{name} ({age})' for name, age in row[6])
+                csvwriter.writerow(row[:6] + (children,))
+
+    def write_xml(self, file, count):
+        # Write users to an XML file, one user at a time.
+        # Parameters: file (str): The path to the XML file, count (int): Number of users.
+        # Returns: None
+        fields = ['firstname', 'telephone_number', 'email', 'password', 'role', 'created_at']
+        with open(file, 'w') as data:
+            data.write('<users>')
+            for row in self.generate(count):
+                data.write('<user>')
+                for field, value in zip(fields, row):
+                    data.write(f'<{field}>{escape(value)}</{field}>')
+                data.write('<children>')
+                for name, age in row[6]:
+                    data.write(f'<child><name>{escape(name)}</name><age>{age}</age></child>')
+                data.write('</children></user>\n')
+            data.write('</users>\n')
+
+    def write_db(self, file, count):
+        # Write users to a SQLite database with the schema of UserDataProcessor.create_database.
+        # Parameters: file (str): The path to the SQLite database file, count (int): Number of users.
+        # Returns: None
+        if os.path.exists(file):
+            os.remove(file)
+        conn = sqlite3.connect(file)
+        cursor = conn.cursor()
+        cursor.execute('''
+            CREATE TABLE users (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                firstname TEXT,
+                telephone_number TEXT,
+                email TEXT,
+                password TEXT,
+                role TEXT,
+                created_at TEXT
+            )
+        ''')
+        cursor.execute('''
+            CREATE TABLE children (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                parent_email TEXT,
+                name TEXT,
+                age INTEGER,
+                FOREIGN KEY (parent_email) REFERENCES users (email)
+            )
+        ''')
+
+        users = []
+        children = []
+        for row in self.generate(count):
+            users.append(row[:6])
+            children.extend((row[2], name, age) for name, age in row[6])
+            if len(users) >= DB_BATCH_SIZE:
+                self._insert_rows(cursor, users, children)
+        self._insert_rows(cursor, users, children)
+        conn.commit()
+        conn.close()
+
+    def _insert_rows(self, cursor, users, children):
+        # Insert buffered users and children and empty the buffers.
+        # Returns: None
+        cursor.executemany('''INSERT INTO users (firstname, telephone_number, email, password, role, created_at)
+                              VALUES (?, ?, ?, ?, ?, ?)''', users)
+        cursor.executemany('INSERT INTO children (parent_email, name, age) VALUES (?, ?, ?)', children)
+        users.clear()
+        children.clear()
@@ -1,68 +1,1228 @@
 import os
-import json
-import csv
-import xml.etree.ElementTree as ET
-from datetime import datetime
-import sqlite3
+import io
+import sys
+import re
+import mmap
+import zlib
+import heapq
+import locale
+from datetime import datetime, timedelta
+import time
+from contextlib import contextmanager
+from collections import Counter
+from itertools import chain, groupby
+from bisect import bisect_left
+# json, csv, xml.etree, sqlite3, pickle, concurrent.futures and tracemalloc are imported
+# where they are used, so a run only pays for the formats and features it needs
+
+CREATED_AT_FORMAT = '%Y-%m-%d %H:%M:%S'
+_EPOCH = datetime(1970, 1, 1)
+_SECOND = timedelta(seconds=1)
+# Valid email: one `@`, one `.` in the domain part and a 1-4 character alphanumeric topdomain
+_EMAIL_PATTERN = re.compile(r'[^@.]+@[^@.]+\.[^\W_]{1,4}')
+# Number of rejected users kept as samples for each rejection reason
+REJECTION_SAMPLE_SIZE = 10
+# Number of rows fetched from SQLite at once
+DB_FETCH_SIZE = 10000
+# Tables of users_database.db
+CREATE_USERS_TABLE_QUERY = '''
+    CREATE TABLE IF NOT EXISTS users (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        firstname TEXT,
+        telephone_number TEXT,
+        email TEXT,
+        password TEXT,
+        role TEXT,
+        created_at TEXT
+    )
+'''
+CREATE_CHILDREN_TABLE_QUERY = '''
+    CREATE TABLE IF NOT EXISTS children (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        parent_email TEXT,
+        name TEXT,
+        age INTEGER,
+        FOREIGN KEY (parent_email) REFERENCES users (email)
+    )
+'''
+# Indexes of users_database.db
+CREATE_INDEX_QUERIES = [
+    'CREATE INDEX IF NOT EXISTS users_email ON users (email)',
+    'CREATE INDEX IF NOT EXISTS users_telephone_number ON users (telephone_number)',
+    'CREATE INDEX IF NOT EXISTS users_created_at ON users (created_at)',
+    'CREATE INDEX IF NOT EXISTS children_parent_email ON children (parent_email)',
+    'CREATE INDEX IF NOT EXISTS children_age ON children (age)',
+]
+DROP_INDEX_QUERIES = [
+    'DROP INDEX IF EXISTS users_email',
+    'DROP INDEX IF EXISTS users_telephone_number',
+    'DROP INDEX IF EXISTS users_created_at',
+    'DROP INDEX IF EXISTS children_parent_email',
+    'DROP INDEX IF EXISTS children_age',
+]
+# Bytes of a CSV file parsed by one worker, smaller files are not split
+CSV_CHUNK_SIZE = 32 * 1024 * 1024
+# Memory budget of the external dedupe in bytes and the estimated size of one buffered key
+DEDUPE_MEMORY_BUDGET = 256 * 1024 * 1024
+DEDUPE_KEY_SIZE = 256
+# Sorted runs merged at once by the external dedupe and records pickled per block
+DEDUPE_MERGE_FAN_IN = 64
+DEDUPE_BLOCK_SIZE = 1024
+# Sharded database: a folder of SQLite files with the users_database.db tables.
+# Users and their children are partitioned by a hash of the email and ids
+# are numbered across all shards, so shards merge back in the original order.
+SHARDED_DATABASE_DIRECTORY = 'users_database_shards'
+SHARD_FILE_PATTERN = 'shard_{}.db'
+# Snapshot of validated and deduplicated users data, kept outside the `data` folder.
+# It is signed with HMAC-SHA256 using a random key kept in `<snapshot file>.key`
+# and never unpickled unless the signature matches
+SNAPSHOT_FILE = '.users_snapshot.pickle'
+SNAPSHOT_DIGEST_SIZE = 32
+# Bump when the snapshot content or the processing rules change
+SNAPSHOT_VERSION = 3
+# Periods of the signup counts
+SIGNUP_PERIODS = ('day', 'month')
+
+def parse_created_at(created_at):
+    # Convert `created_at` text (YYYY-MM-DD HH:MM:SS) into an integer epoch.
+    # Parameters: created_at (str): Account creation date.
+    # Returns: epoch (int): Seconds since 1970-01-01 00:00:00 / None: If created_at is missing.
+    if created_at is None:
+        return None
+    # Exact YYYY-MM-DD HH:MM:SS text is parsed by the faster fromisoformat,
+    # anything else (e.g. without zero padding) as before by strptime
+    if len(created_at) == 19 and created_at[4] + created_at[7] + created_at[10] + created_at[13] + created_at[16] == '-- ::':
+        try:
+            return (datetime.fromisoformat(created_at) - _EPOCH) // _SECOND
+        except ValueError:
+            pass
+    return (datetime.strptime(created_at, CREATED_AT_FORMAT) - _EPOCH) // _SECOND
+
+def format_created_at(epoch):
+    # Convert an integer epoch back into `created_at` text.
+    # Parameters: epoch (int): Seconds since 1970-01-01 00:00:00.
+    # Returns: created_at (str): Account creation date / None: If epoch is missing.
+    if epoch is None:
+        return None
+    return str(_EPOCH + timedelta(seconds=epoch))
+
+def parse_time_bound(text):
+    # Convert a time window bound (YYYY-MM-DD or YYYY-MM-DD HH:MM:SS) into an integer epoch.
+    # Parameters: text (str): Date or date and time.
+    # Returns: epoch (int): Seconds since 1970-01-01 00:00:00 / None: If text is missing.
+    if text is not None and len(text) == 10:
+        text += ' 00:00:00'
+    return parse_created_at(text)
+
+def _signup_period(epoch, period):
+    # Find the day or month of a signup.
+    # Parameters: epoch (int): Account creation time, period (str): 'day' or 'month'.
+    # Returns: label (str): YYYY-MM-DD or YYYY-MM, end (int): Epoch the next period starts at.
+    if period == 'day':
+        start = epoch - epoch % 86400
+        return format_created_at(start)[:10], start + 86400
+    created_at = _EPOCH + timedelta(seconds=epoch)
+    year, month = created_at.year, created_at.month
+    end = datetime(year + month // 12, month % 12 + 1, 1)
+    return f'{year:04d}-{month:02d}', (end - _EPOCH) // _SECOND
+
+def _intern(value):
+    # Intern repeated strings (roles, children names) to share one copy.
+    return sys.intern(value) if type(value) is str else value
+
+class Child:
+    # Child record: name and age.
+    # Still behaves like the old [name, age] list for positional access.
+    __slots__ = ('name', 'age')
+
+    def __init__(self, name, age):
+        self.name = _intern(name)
+        self.age = age
+
+    def to_list(self):
+        return [self.name, self.age]
+
+    def __iter__(self):
+        return iter((self.name, self.age))
+
+    def __len__(self):
+        return 2
+
+    def __getitem__(self, index):
+        return (self.name, self.age)[index]
+
+    def __eq__(self, other):
+        if isinstance(other, (Child, list, tuple)):
+            return (self.name, self.age) == tuple(other)
+        return NotImplemented
+
+    def __reduce__(self):
+        # Pickle as constructor arguments, so names are interned again on load.
+        return (Child, (self.name, self.age))
+
+    def __repr__(self):
+        return f'Child({self.name!r}, {self.age!r})'
+
+class User:
+    # User record with `created_at` kept as an integer epoch.
+    # Still behaves like the old 7 element list for positional access
+    # (index 5 returns `created_at` text, index 6 the children).
+    __slots__ = ('firstname', 'telephone_number', 'email',
+                 'password', 'role', 'created_at', 'children')
+
+    def __init__(self, firstname, telephone_number, email,
+                 password, role, created_at, children):
+        self.firstname = firstname
+        self.telephone_number = telephone_number
+        self.email = email
+        self.password = password
+        self.role = _intern(role)
+        self.created_at = created_at
+        self.children = children
+
+    @classmethod
+    def from_row(cls, firstname, telephone_number, email,
+                 password, role, created_at, children=()):
+        # Create a user from raw loader values. A created_at which cannot be parsed is stored
+        # as None, so the row still reaches validation and never wins a duplicate against a date.
+        # Parameters: created_at (str): Account creation date as text,
+        # children (iterable): (name, age) pairs.
+        # Returns: user (User): The user record.
+        try:
+            created_at = parse_created_at(created_at)
+        except (TypeError, ValueError):
+            created_at = None
+        return cls(firstname, telephone_number, email, password, role, created_at,
+                   [Child(name, age) for name, age in children])
+
+    @property
+    def created_at_text(self):
+        return format_created_at(self.created_at)
+
+    def to_row(self):
+        # Returns: row (tuple): User data in the `users` table column order.
+        return (self.firstname, self.telephone_number, self.email,
+                self.password, self.role, self.created_at_text)
+
+    def to_list(self):
+        # Returns: user (list): User data in the original list layout.
+        return [self.firstname, self.telephone_number, self.email,
+                self.password, self.role, self.created_at_text,
+                [child.to_list() for child in self.children]]
+
+    def __iter__(self):
+        return iter(self.to_list())
+
+    def __len__(self):
+        return 7
+
+    def __getitem__(self, index):
+        return self.to_list()[index]
+
+    def __eq__(self, other):
+        if isinstance(other, User):
+            return self.to_row() == other.to_row() and self.children == other.children
+        if isinstance(other, (list, tuple)):
+            return self.to_list() == list(other)
+        return NotImplemented
+
+    def __reduce__(self):
+        # Pickle as constructor arguments, so roles are interned again on load.
+        return (User, (self.firstname, self.telephone_number, self.email,
+                       self.password, self.role, self.created_at, self.children))
+
+    def __repr__(self):
+        return f'User{tuple(self.to_list())!r}'
+
+def _check_email(user):
+    # Check that user's email looks like `username@domain.topdomain`.
+    # Parameters: user (User): User record.
+    # Returns: reason (str): Why the user is rejected / None: If email is valid.
+    email = user.email
+    if not email:
+        return 'missing_email'
+    if type(email) is not str or _EMAIL_PATTERN.fullmatch(email) is None:
+        return 'invalid_email'
+    return None
+
+def _check_telephone(user):
+    # Check user's telephone number, stripping spaces and country code from it.
+    # Parameters: user (User): User record, its telephone number is normalized in place.
+    # Returns: reason (str): Why the user is rejected / None: If telephone number is valid.
+    telephone_number = user.telephone_number
+    if not telephone_number:
+        return 'missing_telephone'
+    if type(telephone_number) is not str:
+        return 'invalid_telephone'
+    if not (len(telephone_number) == 9 and telephone_number.isnumeric()):
+        telephone_number = telephone_number.replace(' ', '')
+        user.telephone_number = telephone_number[len(telephone_number) - 9:]
+    return None
+
+def _is_newer(created_at, other_created_at):
+    # Compare creation times, a missing created_at is older than any date.
+    # Returns: newer (bool): created_at is strictly newer than other_created_at.
+    return created_at is not None and (other_created_at is None or created_at > other_created_at)
+
+def _newest_by(users, field, winners=None):
+    # Select the newest user for every value of `field` (the first one wins a tie).
+    # A replaced winner is removed and the newer one is inserted at the end,
+    # so winners stay in input order, as in the original list based version.
+    # Parameters: users (iterable): User records, field (str): User attribute name,
+    # winners (dict): Winners selected so far, updated in place.
+    # Returns: winners (dict): field value -> user.
+    if winners is None:
+        winners = {}
+    for user in users:
+        key = getattr(user, field)
+        winner = winners.get(key)
+        if winner is None:
+            winners[key] = user
+        elif _is_newer(user.created_at, winner.created_at):
+            del winners[key]
+            winners[key] = user
+    return winners
+
+def _write_run(records, directory):
+    # Write sorted records to a new run file in pickled blocks.
+    # Parameters: records (iterable): Sorted records, directory (str): Folder of the run files.
+    # Returns: path (str): The path to the run file.
+    import pickle
+    import tempfile
+
+    fd, path = tempfile.mkstemp(suffix='.run', dir=directory)
+    with os.fdopen(fd, 'wb') as run:
+        block = []
+        for record in records:
+            block.append(record)
+            if len(block) >= DEDUPE_BLOCK_SIZE:
+                pickle.dump(block, run, pickle.HIGHEST_PROTOCOL)
+                block = []
+        if block:
+            pickle.dump(block, run, pickle.HIGHEST_PROTOCOL)
+    return path
+
+def _read_run(path):
+    # Read records of a run file written by _write_run.
+    # Parameters: path (str): The path to the run file.
+    # Returns: records (generator): Records in file order.
+    import pickle
+
+    with open(path, 'rb') as run:
+        while True:
+            try:
+                block = pickle.load(run)
+            except EOFError:
+                return
+            yield from block
+
+def _merge_runs(paths):
+    # Merge sorted run files and delete them once they are read.
+    # Parameters: paths (list): The paths to the run files.
+    # Returns: records (generator): Sorted records.
+    try:
+        yield from heapq.merge(*(_read_run(path) for path in paths))
+    finally:
+        for path in paths:
+            os.remove(path)
+
+def _external_sort(records, directory, run_size):
+    # Sort records holding at most run_size of them in memory: sorted runs
+    # are spilled to files and merged, DEDUPE_MERGE_FAN_IN runs at a time.
+    # Parameters: records (iterable): Records, directory (str): Folder of the run files,
+    # run_size (int): Records per run.
+    # Returns: records (generator): Sorted records.
+    runs = []
+    buffer = []
+    for record in records:
+        buffer.append(record)
+        if len(buffer) >= run_size:
+            buffer.sort()
+            runs.append(_write_run(buffer, directory))
+            buffer = []
+    buffer.sort()
+    if not runs:
+        yield from buffer
+        return
+    if buffer:
+        runs.append(_write_run(buffer, directory))
+    del buffer
+
+    while len(runs) > DEDUPE_MERGE_FAN_IN:
+        runs = [_write_run(_merge_runs(runs[i:i + DEDUPE_MERGE_FAN_IN]), directory)
+                for i in range(0, len(runs), DEDUPE_MERGE_FAN_IN)]
+    yield from _merge_runs(runs)
+
+def _first_of_groups(records):
+    # Keep the first record of every group of sorted records with the same first item.
+    # Parameters: records (iterable): Sorted records.
+    # Returns: records (generator): The first record of every group.
+    for key, group in groupby(records, key=lambda record: record[0]):
+        yield next(group)
+
+def _external_newest(users, directory, run_size):
+    # Out-of-core version of remove_duplicates: the newest user by telephone number,
+    # then by email, the first one winning a tie, in input order.
+    # Users are spilled to a records file in input order and only sort keys
+    # (value, -created_at, position) go through the external sorts, so the winners
+    # of a group sort first, then winner positions select users from the records file.
+    # Parameters: users (iterable): User records, directory (str): Folder of the temporary files,
+    # run_size (int): Sort keys held in memory.
+    # Returns: users (generator): Winners in input order.
+    import pickle
+
+    records_path = os.path.join(directory, 'users.records')
+
+    def number_keys(records):
+        block = []
+        for position, user in enumerate(users):
+            block.append(user)
+            if len(block) >= DEDUPE_BLOCK_SIZE:
+                pickle.dump(block, records, pickle.HIGHEST_PROTOCOL)
+                block = []
+            # A missing created_at never wins against a date
+            created_at = -user.created_at if user.created_at is not None else float('inf')
+            yield (user.telephone_number, created_at, position, user.email)
+        if block:
+            pickle.dump(block, records, pickle.HIGHEST_PROTOCOL)
+
+    with open(records_path, 'wb') as records:
+        number_winners = _first_of_groups(_external_sort(number_keys(records), directory, run_size))
+        email_keys = ((email, created_at, position) for number, created_at, position, email in number_winners)
+        email_winners = _first_of_groups(_external_sort(email_keys, directory, run_size))
+        positions = _external_sort((position for email, created_at, position in email_winners), directory, run_size)
+        # All users are spilled once the first winner position is known
+        position = next(positions, None)
+
+    for index, user in enumerate(_read_run(records_path)):
+        if index == position:
+            yield user
+            position = next(positions, None)
+
+def _count_records(users, stage):
+    # Count users passing through a generator as records out of a profiled stage.
+    # Parameters: users (iterable): User records, stage (dict): Stage record of profile_stage.
+    # Returns: users (generator): The same user records.
+    stage['records_out'] = 0
+    for user in users:
+        stage['records_out'] += 1
+        yield user
+
+def _snapshot_key(snapshot_file, create=False):
+    # Read the signing key of a snapshot, creating it readable by the owner only if needed.
+    # Parameters: snapshot_file (str): The path to the snapshot file, create (bool): Create a missing key.
+    # Returns: key (bytes) / None: If the key is missing and not created.
+    key_file = snapshot_file + '.key'
+    try:
+        with open(key_file, 'rb') as f:
+            return f.read()
+    except FileNotFoundError:
+        if not create:
+            return None
+    key = os.urandom(SNAPSHOT_DIGEST_SIZE)
+    try:
+        descriptor = os.open(key_file, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+    except FileExistsError:
+        # Created by another process in the meantime
+        return _snapshot_key(snapshot_file)
+    with os.fdopen(descriptor, 'wb') as f:
+        f.write(key)
+    return key
+
+class _SigningWriter:
+    # File wrapper updating an HMAC with everything written through it.
+    def __init__(self, file, mac):
+        self.file = file
+        self.mac = mac
+
+    def write(self, data):
+        self.mac.update(data)
+        return self.file.write(data)
+
+def files_fingerprint(files):
+    # Identify the content of data files by their path, size and modification time.
+    # Parameters: files (list): The paths to the data files.
+    # Returns: fingerprint (list): (path, size, mtime) for each file.
+    fingerprint = []
+    for file in files or []:
+        stat = os.stat(file)
+        fingerprint.append((file, stat.st_size, stat.st_mtime_ns))
+    return fingerprint
+
+def _parse_children(children_field):
+    # Parse the children field of a CSV row: `Name (age)` items separated by commas.
+    # Rows without children (an empty field) are the most common and skip the split.
+    # Each child is cut once at its last ` (`, any other item is parsed by splitting
+    # on spaces as before, so it gives the same result or error.
+    # Parameters: children_field (str): The children column.
+    # Returns: children (list): (name, age) pairs.
+    children = []
+    if children_field:
+        for child in children_field.split(','):
+            if child:
+                name, separator, age = child.rpartition(' (')
+                if separator and age[-1:] == ')' and age[:-1].isdigit() and ' ' not in name:
+                    children.append((name, int(age[:-1])))
+                else:
+                    child_data = child.split(' ')
+                    children.append((child_data[0], int(child_data[1].replace('(', '').replace(')', ''))))
+    return children
+
+def _csv_ranges(file, chunk_size):
+    # Split the rows of a CSV file (after its header) into newline aligned byte ranges.
+    # A quoted field may contain a newline, so a file with quotes is not split.
+    # Parameters: file (str): The path to the CSV file, chunk_size (int): Approximate bytes per range.
+    # Returns: ranges (list): (start, end) byte offsets / None: If the file is not split.
+    size = os.path.getsize(file)
+    if size <= chunk_size:
+        return None
+    with open(file, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+        if data.find(b'"') != -1:
+            return None
+        start = data.find(b'\n') + 1
+        if start == 0:
+            return None
+        ranges = []
+        while start < size:
+            end = data.find(b'\n', start + chunk_size - 1)
+            end = size if end == -1 else end + 1
+            ranges.append((start, end))
+            start = end
+    return ranges
+
+def _read_csv_range(file, start, end):
+    # Parse users from a newline aligned byte range of a CSV file in a worker process,
+    # decoding and splitting lines as reading the file in text mode does.
+    # Parameters: file (str): The path to the CSV file, start (int), end (int): Byte offsets.
+    # Returns: users (list): User records.
+    import csv
+
+    with open(file, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+        text = data[start:end].decode(locale.getpreferredencoding(False))
+    csvreader = csv.reader(io.StringIO(text, newline=None), delimiter=';')
+    return [User.from_row(*row[:6], _parse_children(row[6])) for row in csvreader]
+
+def shard_of(email, shards):
+    # Select the shard of a user by a stable hash of the email.
+    # Parameters: email (str): User's email, shards (int): Number of shards.
+    # Returns: shard (int): Shard number.
+    return zlib.crc32(str(email).encode()) % shards
+
+def shard_files(directory):
+    # Find the shard files of a sharded database.
+    # Parameters: directory (str): The path to the sharded database folder.
+    # Returns: files (list): The paths to the shard files in shard order.
+    files = []
+    while os.path.exists(os.path.join(directory, SHARD_FILE_PATTERN.format(len(files)))):
+        files.append(os.path.join(directory, SHARD_FILE_PATTERN.format(len(files))))
+    return files
+
+def _write_shard(file, users, children, sync=False):
+    # Write one shard of a sharded database, called from a thread per shard.
+    # Parameters: file (str): The path to the shard file,
+    # users (list): (id, firstname, telephone_number, email, password, role, created_at) rows,
+    # children (list): (id, parent_email, name, age) rows,
+    # sync (bool): Leave the shard untouched if it already has these rows.
+    # Returns: written (bool): False if the shard was up to date.
+    import sqlite3
+
+    conn = sqlite3.connect(file, isolation_level=None)
+    try:
+        cursor = conn.cursor()
+        cursor.execute('PRAGMA journal_mode=WAL')
+        cursor.execute('PRAGMA synchronous=NORMAL')
+        cursor.execute(CREATE_USERS_TABLE_QUERY)
+        cursor.execute(CREATE_CHILDREN_TABLE_QUERY)
+
+        if sync:
+            stored_users = cursor.execute('SELECT id, firstname, telephone_number, email, password, role, created_at FROM users ORDER BY id').fetchall()
+            stored_children = cursor.execute('SELECT id, parent_email, name, age FROM children ORDER BY id').fetchall()
+            if stored_users == users and stored_children == children:
+                return False
+
+        cursor.execute('BEGIN')
+        try:
+            for drop_index_query in DROP_INDEX_QUERIES:
+                cursor.execute(drop_index_query)
+            cursor.execute('DELETE FROM users')
+            cursor.executemany('INSERT INTO users (id, firstname, telephone_number, email, password, role, created_at) VALUES (?, ?, ?, ?, ?, ?, ?)', users)
+            cursor.execute('DELETE FROM children')
+            cursor.executemany('INSERT INTO children (id, parent_email, name, age) VALUES (?, ?, ?, ?)', children)
+            for create_index_query in CREATE_INDEX_QUERIES:
+                cursor.execute(create_index_query)
+            cursor.execute('COMMIT')
+        except Exception:
+            cursor.execute('ROLLBACK')
+            raise
+    finally:
+        conn.close()
+    return True
+
+def _read_shard(file):
+    # Read users of one shard with their ids, in a worker process.
+    # Parameters: file (str): The path to the shard file.
+    # Returns: users (list): (id, user) pairs ordered by id.
+    import sqlite3
+
+    conn = sqlite3.connect(file)
+    try:
+        children_by_email = {}
+        for parent_email, name, age in conn.execute('SELECT parent_email, name, age FROM children ORDER BY id'):
+            children_by_email.setdefault(parent_email, []).append((name, age))
+
+        user_query = 'SELECT id, firstname, telephone_number, email, password, role, created_at FROM users ORDER BY id'
+        return [(row[0], User.from_row(*row[1:], children_by_email.get(row[3], ())))
+                for row in conn.execute(user_query)]
+    finally:
+        conn.close()
+
+def _read_file(file, start=None, end=None):
+    # Parse one data file, or a byte range of a CSV file, in a worker process.
+    # Parameters: file (str): The path to the data file,
+    # start (int), end (int): Byte range of a CSV file, None for the whole file.
+    # Returns: users (list): User records.
+    if start is not None:
+        return _read_csv_range(file, start, end)
+    return list(UserDataProcessor()._iter_file(file))
 
 class UserDataProcessor:
     def __init__(self):
         self.users = []
+        # Login index: telephone number / email -> user record
+        self._login_index = {}
+        # Users rejected by validation: reason -> count and reason -> sample users
+        self.rejections = Counter()
+        self._rejection_samples = {}
+        # Aggregates for the admin commands
+        self._oldest_user = None
+        self._age_counts = Counter()
+        # Age index: child age -> positions of parents in users data,
+        # built on first use after the users data changes
+        self._age_index = None
+        # Created_at index: created_at values in ascending order and positions of their users
+        # in users data (ties in users data order), built on first use after the users data
+        # changes and filtered instead of sorted again when users are rejected or deduplicated
+        self._created_at_index = None
+        # Children sorted by name, cached by position in users data
+        self._sorted_children = {}
+        # Incremental import state: data files in order, their fingerprints
+        # and validated users of each file (None if not imported incrementally)
+        self._files = []
+        self._file_fingerprints = {}
+        self._file_users = None
+        # Duplicate groups of the incremental import, built when needed:
+        # id(user) -> (file, position in file), telephone number / email -> {id(user): user}
+        # and the newest user of every group
+        self._origins = None
+        self._number_groups = None
+        self._number_winners = None
+        self._email_groups = None
+        self._email_winners = None
+        # Stage records of profile_stage, None unless profiling is enabled
+        self.profile = None
+        # CSV files larger than this are parsed in byte ranges by parallel workers
+        self.csv_chunk_size = CSV_CHUNK_SIZE
+        # OutputWriter of the running command, results are printed when it is None
+        self.output = None
+
+    def enable_profiling(self, trace_memory=True):
+        # Record wall time, CPU time, records in / out and peak memory of every stage
+        # (discovery, loading of each file, validators, dedupe, commands) in self.profile.
+        # Parameters: trace_memory (bool): Measure peak memory with tracemalloc (slows stages down).
+        # Returns: None
+        import tracemalloc
+
+        self.profile = []
+        if trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    @contextmanager
+    def profile_stage(self, stage):
+        # Profile a stage when profiling is enabled. Records in / out default to
+        # the number of users before / after the stage. Stages must not be nested,
+        # because each one resets the tracemalloc peak.
+        # Parameters: stage (str): Stage name.
+        # Returns: record (dict): Stage record, records_in / records_out can be set by the caller.
+        record = {'stage': stage, 'records_in': len(self.users)}
+        if self.profile is None:
+            yield record
+            return
+
+        import tracemalloc
+
+        tracing = tracemalloc.is_tracing()
+        if tracing:
+            tracemalloc.reset_peak()
+        wall_start = time.perf_counter()
+        cpu_start = time.process_time()
+        try:
+            yield record
+        finally:
+            wall_seconds = time.perf_counter() - wall_start
+            cpu_seconds = time.process_time() - cpu_start
+            record.setdefault('records_out', len(self.users))
+            record['wall_seconds'] = round(wall_seconds, 6)
+            record['cpu_seconds'] = round(cpu_seconds, 6)
+            if tracing:
+                record['peak_memory_mb'] = round(tracemalloc.get_traced_memory()[1] / 1024 / 1024, 3)
+            self.profile.append(record)
+
+    @contextmanager
+    def _profile_load(self, file):
+        # Profile loading a data file: records in are parsed rows,
+        # records out are users kept (rows minus rejected users by default).
+        # Parameters: file (str): The path to the data file.
+        # Returns: record (dict): Stage record.
+        with self.profile_stage(f'load:{file}') as record:
+            users = len(self.users)
+            rejected = sum(self.rejections.values())
+            yield record
+            record.setdefault('records_out', len(self.users) - users)
+            record['records_in'] = record['records_out'] + sum(self.rejections.values()) - rejected
+
+    def profile_summary(self):
+        # Summarize the profiled stages.
+        # Returns: summary (dict): Stage records and totals / None: If profiling is not enabled.
+        if self.profile is None:
+            return None
+        peaks = [record['peak_memory_mb'] for record in self.profile if 'peak_memory_mb' in record]
+        return {
+            'wall_seconds': round(sum(record['wall_seconds'] for record in self.profile), 6),
+            'cpu_seconds': round(sum(record['cpu_seconds'] for record in self.profile), 6),
+            'peak_memory_mb': max(peaks) if peaks else None,
+            'stages': self.profile
+        }
+
+    def _index_user(self, user):
+        # Add user's telephone number and email to the login index
+        # and update the oldest account and children age counts.
+        # The first user with a given login wins, same as a linear scan would.
+        # Parameters: user (User): User record.
+        # Returns: None
+        self._login_index.setdefault(user.telephone_number, user)
+        self._login_index.setdefault(user.email, user)
+
+        if user.created_at is not None:
+            if self._oldest_user is None or self._oldest_user.created_at > user.created_at:
+                self._oldest_user = user
+
+        for child in user.children:
+            self._age_counts[child.age] += 1
+
+    def _rebuild_indexes(self, previous_users=None):
+        # Rebuild the login index and aggregates from the current users data
+        # and drop the indexes which are built on demand.
+        # Parameters: previous_users (list): Users data before validation or dedupe kept a part of it
+        # in the same order, the created_at index of previous_users is filtered instead of dropped.
+        # Returns: None
+        created_at_index = None
+        if previous_users is not None and self._created_at_index is not None:
+            created_at_index = self._filter_created_at_index(previous_users)
+        self._login_index = {}
+        self._oldest_user = None
+        self._age_counts = Counter()
+        for user in self.users:
+            self._index_user(user)
+        self._age_index = None
+        self._created_at_index = created_at_index
+        self._sorted_children = {}
+
+    def _add_user(self, user):
+        # Append a user record to the users data and index it.
+        # Parameters: user (User): User record.
+        # Returns: None
+        self.users.append(user)
+        self._index_user(user)
+        self._age_index = None
+        self._created_at_index = None
+        self._file_users = None
+        self._number_groups = None
+
+    def _get_age_index(self):
+        # Return the child age -> parent positions index, building it if needed.
+        # Returns: age_index (dict): age -> positions of parents in users data (ascending).
+        if self._age_index is None:
+            age_index = {}
+            for position, user in enumerate(self.users):
+                for child in user.children:
+                    positions = age_index.setdefault(child.age, [])
+                    if not positions or positions[-1] != position:
+                        positions.append(position)
+            self._age_index = age_index
+        return self._age_index
+
+    def _get_created_at_index(self):
+        # Return the created_at index, building it if needed. Users without created_at are not indexed.
+        # Returns: created_at_index (tuple): created_at values (ascending), positions of their users in users data.
+        if self._created_at_index is None:
+            users = self.users
+            positions = [position for position, user in enumerate(users) if user.created_at is not None]
+            # Sorting is stable, so users created at the same time stay in users data order
+            positions.sort(key=lambda position: users[position].created_at)
+            self._created_at_index = ([users[position].created_at for position in positions], positions)
+        return self._created_at_index
+
+    def _filter_created_at_index(self, previous_users):
+        # Keep the created_at index entries of users still in users data, in linear time.
+        # Parameters: previous_users (list): Users data the index was built for.
+        # Returns: created_at_index (tuple): created_at values (ascending), positions of their users in users data.
+        new_positions = {id(user): position for position, user in enumerate(self.users)}
+        created_at_values, positions = self._created_at_index
+        new_created_at_values = []
+        kept_positions = []
+        for created_at, position in zip(created_at_values, positions):
+            new_position = new_positions.get(id(previous_users[position]))
+            if new_position is not None:
+                new_created_at_values.append(created_at)
+                kept_positions.append(new_position)
+        return new_created_at_values, kept_positions
+
+    def _get_sorted_children(self, position):
+        # Return children of the user at `position` sorted by name,
+        # without reordering the user's own children list.
+        # Parameters: position (int): Position of the user in users data.
+        # Returns: children (list): Children sorted alphabetically.
+        children = self._sorted_children.get(position)
+        if children is None:
+            children = sorted(self.users[position].children, key=lambda child: child.name)
+            self._sorted_children[position] = children
+        return children
+
+    def save_snapshot(self, snapshot_file, files):
+        # Save the users data, so it can be loaded without processing `files` again.
+        # Parameters: snapshot_file (str): The path to the snapshot file,
+        # files (list): The paths to the data files the users data comes from.
+        # Returns: None
+        import pickle
+        import hmac
+
+        snapshot = {
+            'version': SNAPSHOT_VERSION,
+            'fingerprint': files_fingerprint(files),
+            'users': self.users,
+            'incremental': None,
+        }
+        if self._file_users is not None:
+            snapshot['incremental'] = {
+                'files': self._files,
+                'fingerprints': self._file_fingerprints,
+                'users': self._file_users,
+            }
+        # The signature is written in front of the pickled data once it is known
+        mac = hmac.new(_snapshot_key(snapshot_file, create=True), digestmod='sha256')
+        temp_file = snapshot_file + '.tmp'
+        with open(temp_file, 'wb') as f:
+            f.write(bytes(SNAPSHOT_DIGEST_SIZE))
+            pickle.dump(snapshot, _SigningWriter(f, mac), protocol=pickle.HIGHEST_PROTOCOL)
+            f.seek(0)
+            f.write(mac.digest())
+        os.replace(temp_file, snapshot_file)
+
+    def load_snapshot(self, snapshot_file, files):
+        # Load the users data from a snapshot if none of `files` changed since it was saved.
+        # If some files changed and the snapshot was saved after import_data_incremental,
+        # its per file state is still restored, so the next import_data_incremental
+        # call re-imports only the changed files.
+        # A snapshot whose signature does not match its key is ignored without unpickling it.
+        # Parameters: snapshot_file (str): The path to the snapshot file,
+        # files (list): The paths to the data files.
+        # Returns: bool: True if the snapshot was loaded.
+        import pickle
+        import hmac
+
+        try:
+            key = _snapshot_key(snapshot_file)
+            if key is None:
+                return False
+            with open(snapshot_file, 'rb') as f:
+                digest = f.read(SNAPSHOT_DIGEST_SIZE)
+                mac = hmac.new(key, digestmod='sha256')
+                for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                    mac.update(chunk)
+                if not hmac.compare_digest(digest, mac.digest()):
+                    print('Error loading snapshot: signature does not match')
+                    return False
+                f.seek(SNAPSHOT_DIGEST_SIZE)
+                snapshot = pickle.load(f)
+        except FileNotFoundError:
+            return False
+        except Exception as e:
+            print(f'Error loading snapshot: {e}')
+            return False
+
+        if snapshot.get('version') != SNAPSHOT_VERSION:
+            return False
+
+        incremental = snapshot['incremental']
+        if incremental is not None:
+            self._files = incremental['files']
+            self._file_fingerprints = incremental['fingerprints']
+            self._file_users = incremental['users']
+            self._number_groups = None
+
+        if snapshot['fingerprint'] != files_fingerprint(files):
+            return False
+
+        self.users = snapshot['users']
+        self._rebuild_indexes()
+        return True
+
+    @property
+    def incremental(self):
+        # Returns: incremental (bool): Per file state is kept, so import_data_incremental
+        # re-imports only the changed files.
+        return self._file_users is not None
+
+    def import_data_incremental(self, files, workers=1):
+        # Load, validate and deduplicate data, re-importing only the files
+        # added, removed or modified since the previous call.
+        # Validated users are kept per file, so users of a changed file are retracted
+        # and duplicates are resolved again only for their telephone numbers and emails.
+        # The result is the same as import_data followed by validate_emails,
+        # validate_telephone and remove_duplicates.
+        # Parameters: files (list): The paths to the data files,
+        # workers (int): Number of processes parsing changed files in parallel.
+        # Returns: changed_files (list): The paths to the re-imported or removed files.
+        files = list(files or [])
+        fingerprints = {file: (size, mtime) for file, size, mtime in files_fingerprint(files)}
+        if self._file_users is None:
+            self._files = []
+            self._file_fingerprints = {}
+            self._file_users = {}
+            self._number_groups = None
+
+        removed = [file for file in self._files if file not in fingerprints]
+        changed = [file for file in files if self._file_fingerprints.get(file) != fingerprints[file]]
+        if not removed and not changed and files == self._files:
+            return []
+
+        # Unchanged files in a different order change which duplicate comes first,
+        # so duplicates are resolved again from scratch (without parsing files)
+        kept_files = [file for file in files if file in self._file_fingerprints]
+        if kept_files != [file for file in self._files if file in fingerprints]:
+            self._number_groups = None
+        else:
+            self._build_duplicate_groups()
+        groups = self._number_groups
+        numbers = set()
+
+        # Retract users of removed and modified files
+        for file in removed + changed:
+            users = self._file_users.pop(file, ())
+            if groups is not None:
+                for user in users:
+                    numbers.add(user.telephone_number)
+                    del groups[user.telephone_number][id(user)]
+                    del self._origins[id(user)]
+            self._file_fingerprints.pop(file, None)
+
+        # Import added and modified files
+        if workers > 1:
+            parsed_files = self._parse_files_parallel(changed, workers)
+        else:
+            parsed_files = ((file, self._iter_file(file)) for file in changed)
+        for file, users in parsed_files:
+            with self._profile_load(file) as record:
+                users = list(self._iter_valid_users(users))
+                record['records_out'] = len(users)
+            if groups is not None:
+                for i, user in enumerate(users):
+                    numbers.add(user.telephone_number)
+                    groups.setdefault(user.telephone_number, {})[id(user)] = user
+                    self._origins[id(user)] = (file, i)
+            self._file_users[file] = users
+            self._file_fingerprints[file] = fingerprints[file]
+        self._files = files
+
+        with self.profile_stage('remove_duplicates') as record:
+            record['records_in'] = sum(len(users) for users in self._file_users.values())
+            if groups is None:
+                self._build_duplicate_groups()
+            else:
+                self._resolve_duplicates(numbers)
+
+            self.users = [user for file in files for user in self._file_users[file]
+                          if self._email_winners.get(user.email) is user]
+            self._rebuild_indexes()
+        return removed + changed
 
-    def import_data(self, files):
+    def _resolve_duplicates(self, numbers):
+        # Select the newest users again for the affected telephone numbers
+        # and for the emails of their previous and new winners.
+        # Parameters: numbers (set): Affected telephone numbers.
+        # Returns: None
+        ranks = {file: rank for rank, file in enumerate(self._files)}
+        emails = set()
+        for number in numbers:
+            group = self._number_groups.get(number)
+            winner = self._newest_in_group(group, ranks) if group else None
+            if not group:
+                self._number_groups.pop(number, None)
+            previous_winner = self._number_winners.pop(number, None)
+            if previous_winner is not winner:
+                if previous_winner is not None:
+                    emails.add(previous_winner.email)
+                    del self._email_groups[previous_winner.email][id(previous_winner)]
+                if winner is not None:
+                    emails.add(winner.email)
+                    self._email_groups.setdefault(winner.email, {})[id(winner)] = winner
+            if winner is not None:
+                self._number_winners[number] = winner
+
+        for email in emails:
+            group = self._email_groups.get(email)
+            if group:
+                self._email_winners[email] = self._newest_in_group(group, ranks)
+            else:
+                self._email_groups.pop(email, None)
+                self._email_winners.pop(email, None)
+
+    def _build_duplicate_groups(self):
+        # Build the duplicate groups of the incremental import from its per file users.
+        # Returns: None
+        if self._number_groups is not None:
+            return
+        self._origins = {}
+        self._number_groups = {}
+        users = []
+        for file in self._files:
+            for i, user in enumerate(self._file_users[file]):
+                self._origins[id(user)] = (file, i)
+                self._number_groups.setdefault(user.telephone_number, {})[id(user)] = user
+                users.append(user)
+
+        self._number_winners = _newest_by(users, 'telephone_number')
+        self._email_groups = {}
+        for user in self._number_winners.values():
+            self._email_groups.setdefault(user.email, {})[id(user)] = user
+        self._email_winners = _newest_by(self._number_winners.values(), 'email')
+
+    def _newest_in_group(self, group, ranks):
+        # Select the newest user of a duplicate group, the first one in files order wins a tie.
+        # Parameters: group (dict): id -> user, ranks (dict): file -> position in files order.
+        # Returns: user (User): The newest user.
+        winner = None
+        winner_position = None
+        for user in group.values():
+            file, i = self._origins[id(user)]
+            position = (ranks[file], i)
+            if (winner is None or _is_newer(user.created_at, winner.created_at)
+                    or (user.created_at == winner.created_at and position < winner_position)):
+                winner = user
+                winner_position = position
+        return winner
+
+    def import_data(self, files, workers=1, validate=False):
         # Load data from JSON, CSV, XML
-        # Parameters: files (list): The paths to the SQLite database file.
+        # Parameters: files (list): The paths to the SQLite database file,
+        # workers (int): Number of processes parsing files in parallel,
+        # validate (bool): Validate users while loading, same as validate_users afterwards.
         # Returns: None
+        if workers > 1:
+            self._import_data_parallel(list(files), workers, validate)
+            return
+
+        if validate:
+            for file in files:
+                with self._profile_load(file):
+                    for user in self._iter_valid_users(self._iter_file(file)):
+                        self._add_user(user)
+            return
+
         for file in files:
-            if file.endswith('.json'):
-                self._load_json(file)
-            elif file.endswith('.csv'):
-                self._load_csv(file)
-            elif file.endswith('.xml'):
-                self._load_xml(file)
-            elif file.endswith('.db'):
-                self._load_db(file)
+            with self._profile_load(file):
+                if file.endswith('.json'):
+                    self._load_json(file)
+                elif file.endswith('.csv'):
+                    self._load_csv(file)
+                elif file.endswith('.xml'):
+                    self._load_xml(file)
+                elif file.endswith('.db'):
+                    self._load_db(file)
+
+    def _import_data_parallel(self, files, workers, validate=False):
+        # Parse files in a process pool and merge the results in file order,
+        # so the users data is the same as after a serial import.
+        # Parameters: files (list): The paths to the data files,
+        # workers (int): Number of processes, validate (bool): Validate users while loading.
+        # Returns: None
+        for file, users in self._parse_files_parallel(files, workers):
+            with self._profile_load(file):
+                if validate:
+                    users = self._iter_valid_users(users)
+                for user in users:
+                    self._add_user(user)
+
+    def _parse_files_parallel(self, files, workers):
+        # Parse files in a process pool. CSV files larger than csv_chunk_size are split
+        # into newline aligned byte ranges parsed by different workers.
+        # Parameters: files (list): The paths to the data files, workers (int): Number of processes.
+        # Returns: parsed_files (generator): (file, users) pairs in file order, the pool is open while it runs.
+        files = list(files)
+        tasks = []
+        for position, file in enumerate(files):
+            ranges = _csv_ranges(file, self.csv_chunk_size) if file.endswith('.csv') else None
+            if ranges:
+                tasks.extend((position, file, start, end) for start, end in ranges)
+            else:
+                tasks.append((position, file, None, None))
+        if not tasks:
+            return
+        if len(tasks) == 1:
+            yield files[0], self._iter_file(files[0])
+            return
+
+        from concurrent.futures import ProcessPoolExecutor
+
+        positions, task_files, starts, ends = zip(*tasks)
+        chunksize = max(1, len(tasks) // (workers * 4))
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            results = zip(positions, executor.map(_read_file, task_files, starts, ends, chunksize=chunksize))
+            # Ranges of one file are merged back in order
+            for position, file_results in groupby(results, key=lambda result: result[0]):
+                yield files[position], chain.from_iterable(users for position, users in file_results)
+
+    def import_data_stream(self, files):
+        # Load, validate and deduplicate data in one streaming pass.
+        # Records are pulled lazily from the loaders and filtered on the fly,
+        # so only the current duplicate winners are held in memory.
+        # The result is the same as import_data followed by validate_emails,
+        # validate_telephone and remove_duplicates.
+        # Parameters: files (list): The paths to the data files.
+        # Returns: None
+        self._file_users = None
+        self._number_groups = None
+        number_winners = {}
+        for file in files:
+            with self._profile_load(file) as record:
+                users = self._iter_valid_users(self._iter_file(file))
+                if self.profile is not None:
+                    users = _count_records(users, record)
+                _newest_by(users, 'telephone_number', number_winners)
+        with self.profile_stage('remove_duplicates') as record:
+            record['records_in'] = len(number_winners)
+            self.users = list(_newest_by(number_winners.values(), 'email').values())
+            self._rebuild_indexes()
+
+    def import_data_external(self, files, memory_budget=DEDUPE_MEMORY_BUDGET, temp_dir=None):
+        # Load, validate and deduplicate data which does not fit in memory.
+        # The result is the same as import_data followed by validate_emails,
+        # validate_telephone and remove_duplicates.
+        # Parameters: files (list): The paths to the data files,
+        # memory_budget (int): Bytes of sort keys held in memory, the rest is spilled to temporary files,
+        # temp_dir (str): Folder of the temporary files (default: the system temporary folder).
+        # Returns: None
+        self._file_users = None
+        self._number_groups = None
+        with self.profile_stage('import_data_external'):
+            self.users = list(self.iter_deduplicated(files, memory_budget, temp_dir))
+            self._rebuild_indexes()
+
+    def iter_deduplicated(self, files, memory_budget=DEDUPE_MEMORY_BUDGET, temp_dir=None):
+        # Stream valid users of data files without duplicates, sorting keys out of core
+        # (see _external_newest), so winners can be written out without keeping them.
+        # Parameters: files (list): The paths to the data files,
+        # memory_budget (int): Bytes of sort keys held in memory,
+        # temp_dir (str): Folder of the temporary files.
+        # Returns: users (generator): Winners in input order.
+        import tempfile
+
+        run_size = max(1, memory_budget // DEDUPE_KEY_SIZE)
+        with tempfile.TemporaryDirectory(prefix='users_dedupe_', dir=temp_dir) as directory:
+            users = (user for file in files for user in self._iter_valid_users(self._iter_file(file)))
+            yield from _external_newest(users, directory, run_size)
+
+    def import_sharded_database(self, directory, workers=1):
+        # Load users from a sharded database. Shards are read in parallel
+        # and merged by id, so users are in the order they were written in.
+        # Parameters: directory (str): The path to the sharded database folder,
+        # workers (int): Number of processes reading shards in parallel.
+        # Returns: None
+        files = shard_files(directory)
+        with self._profile_load(directory):
+            if workers > 1 and len(files) > 1:
+                from concurrent.futures import ProcessPoolExecutor
+
+                with ProcessPoolExecutor(max_workers=workers) as executor:
+                    shards = list(executor.map(_read_shard, files))
+            else:
+                shards = [_read_shard(file) for file in files]
+
+            for user_id, user in heapq.merge(*shards, key=lambda shard_user: shard_user[0]):
+                self._add_user(user)
+
+    def _iter_file(self, file):
+        # Yield users from a JSON, CSV, XML or DB file.
+        # Parameters: file (str): The path to the data file.
+        # Returns: users (generator): User records.
+        if file.endswith('.json'):
+            return self._iter_json(file)
+        elif file.endswith('.csv'):
+            return self._iter_csv(file)
+        elif file.endswith('.xml'):
+            return self._iter_xml(file)
+        elif file.endswith('.db'):
+            return self._iter_db(file)
+        return iter(())
 
     def _load_db(self, file):
         # Load data from a SQLite database file
         # Parameters: file (str): The path to the SQLite database file.
         # Returns: None
+        for user in self._iter_db(file):
+            self._add_user(user)
+
+    def _iter_db(self, file):
+        # Yield users from a SQLite database file
+        # Parameters: file (str): The path to the SQLite database file.
+        # Returns: users (generator): User records.
+        import sqlite3
+
         conn = sqlite3.connect(file)
 
         cursor = conn.cursor()
 
+        # Group children by parent email, so each user is joined with one lookup
+        children_query = 'SELECT parent_email, name, age FROM children'
+        res = cursor.execute(children_query)
+        children_by_email = {}
+        while True:
+            data = res.fetchmany(DB_FETCH_SIZE)
+            if not data:
+                break
+            for parent_email, name, age in data:
+                children_by_email.setdefault(parent_email, []).append((name, age))
+
         user_query = """SELECT firstname, telephone_number, email, 
                         password, role, created_at FROM users"""
 
         res = cursor.execute(user_query)
-        data = res.fetchall()
-
-        users = []
-        for row in data:
-            row = list(row)
-            row.append([])
-            users.append(row)
-
-        # Load children data and associate with users
-        children_query = 'SELECT parent_email, name, age FROM children'
-        res = cursor.execute(children_query)
-        data = res.fetchall()
-
-        for row in data:
-            row = list(row)
-            for user in users:
-                if user[2] == row[0]:
-                    user[6].append([row[1], row[2]])
+        try:
+            while True:
+                data = res.fetchmany(DB_FETCH_SIZE)
+                if not data:
+                    break
+                for row in data:
+                    yield User.from_row(*row, children_by_email.get(row[2], ()))
+        finally:
+            conn.close()
 
-        conn.close()
-        self.users = users
-    
     def _load_json(self, file):
         # Load data from JSON file
         # Parameters: file (str): The path to the JSON file.
         # Returns: None
+        for user in self._iter_json(file):
+            self._add_user(user)
+
+    def _iter_json(self, file):
+        # Yield users from JSON file
+        # Parameters: file (str): The path to the JSON file.
+        # Returns: users (generator): User records.
+        import json
+
         f = open(file)
         data = json.load(f)
+        f.close()
         for row in data:
             firstname = row.get('firstname')
             telephone_number = row.get('telephone_number')
@@ -78,181 +1238,287 @@ class UserDataProcessor:
                     if child:
                         name = child['name']
                         age = child['age']
-                        children.append([name, age])
+                        children.append((name, age))
                 except (AttributeError, ValueError) as e:
                     print(f'Error processing JSON child data: {e}')   
 
-            self.users.append([firstname, telephone_number,
-                               email, password, role, 
-                               created_at, children])
-        f.close()
+            yield User.from_row(firstname, telephone_number,
+                                email, password, role,
+                                created_at, children)
 
     def _load_csv(self, file):
         # Load data from CSV file
         # Parameters: file (str): The path to the CSV file.
         # Returns: None
+        for user in self._iter_csv(file):
+            self._add_user(user)
+
+    def _iter_csv(self, file):
+        # Yield users from CSV file
+        # Parameters: file (str): The path to the CSV file.
+        # Returns: users (generator): User records.
+        import csv
+
         with open(file, 'r') as data:
             csvreader = csv.reader(data, delimiter=';')
             header = next(csvreader)
             for row in csvreader:
-                children_data = row[6].split(',')
-                children = []
-                for child in children_data:
-                    if child:
-                        child_data = child.split(' ')
-                        child_data[1] = int(child_data[1].replace('(', '').replace(')', ''))
-                        name = child_data[0]
-                        age = child_data[1]
-                        children.append([name, age])
-                row[6] = children
-                self.users.append(row)
+                yield User.from_row(*row[:6], _parse_children(row[6]))
 
     def _load_xml(self, file):
         # Load data from XML file
         # Parameters: file (str): The path to the XML file.
         # Returns: None
-        tree = ET.parse(file)
-        root = tree.getroot()
+        for user in self._iter_xml(file):
+            self._add_user(user)
+
+    def _iter_xml(self, file):
+        # Yield users from XML file while it is parsed incrementally.
+        # Every child of the root element is cleared once it is complete,
+        # so memory does not grow with the file size. Only `user` elements
+        # directly under the root are users, as with `root.findall('user')`.
+        # Parameters: file (str): The path to the XML file.
+        # Returns: users (generator): User records.
+        import xml.etree.ElementTree as ET
+
+        root = None
+        depth = 0
+        for event, element in ET.iterparse(file, events=('start', 'end')):
+            if event == 'start':
+                if root is None:
+                    root = element
+                depth += 1
+                continue
+
+            depth -= 1
+            if depth != 1:
+                continue
+
+            user = None
+            if element.tag == 'user':
+                user = self._xml_user(element)
+            root.clear()
+            if user is not None:
+                yield user
+
+    def _xml_user(self, users):
+        # Convert a `user` element of an XML file into a user record.
+        # Parameters: users (Element): The `user` element.
+        # Returns: user (User): User record.
+        firstname = users.find('firstname').text
+        telephone_number = users.find('telephone_number').text
+        email = users.find('email').text
+        password  = users.find('password').text
+        role = users.find('role').text
+        created_at = users.find('created_at').text
+        children = []
+
+        for child in users.findall('./children/child'):
+            try:
+                if child:
+                    name = child.find('name').text
+                    age = int(child.find('age').text)
+                    children.append((name, age))
+            except Exception as e:
+                print(f'Error processing XML child data: {e}')      
+
+        return User.from_row(firstname, telephone_number,
+                             email, password, role,
+                             created_at, children)
+
+    def _iter_valid_users(self, users):
+        # Lazily filter users with valid emails and telephone numbers in a single pass.
+        # Telephone numbers are normalized and rejected users are counted by reason.
+        # Parameters: users (iterable): User records.
+        # Returns: users (generator): Valid user records.
+        for user in users:
+            reason = _check_email(user) or _check_telephone(user)
+            if reason is None:
+                yield user
+            else:
+                self._reject(user, reason)
 
-        for users in root.findall('user'):
-            firstname = users.find('firstname').text
-            telephone_number = users.find('telephone_number').text
-            email = users.find('email').text
-            password  = users.find('password').text
-            role = users.find('role').text
-            created_at = users.find('created_at').text
-            children = []
+    def _filter_users(self, check):
+        # Keep only users which pass `check` and rebuild the indexes.
+        # Parameters: check (function): Returns a rejection reason or None for a user.
+        # Returns: None
+        new_users = []
+        for user in self.users:
+            reason = check(user)
+            if reason is None:
+                new_users.append(user)
+            else:
+                self._reject(user, reason)
 
-            for child in users.findall('./children/child'):
-                try:
-                    if child:
-                        name = child.find('name').text
-                        age = int(child.find('age').text)
-                        children.append([name, age])
-                except Exception as e:
-                    print(f'Error processing XML child data: {e}')      
+        previous_users = self.users
+        self.users = new_users
+        self._rebuild_indexes(previous_users)
 
-            self.users.append([firstname, telephone_number,
-                               email, password, role,
-                               created_at, children])
+    def _reject(self, user, reason):
+        # Count a rejected user and keep it as a sample.
+        # Parameters: user (User): Rejected user, reason (str): Why the user is rejected.
+        # Returns: None
+        self.rejections[reason] += 1
+        samples = self._rejection_samples.setdefault(reason, [])
+        if len(samples) < REJECTION_SAMPLE_SIZE:
+            samples.append(user.to_list())
+
+    def validate_users(self):
+        # Validate email addresses and telephone numbers in one pass over the users data.
+        # Returns: None
+        with self.profile_stage('validate_users'):
+            self._filter_users(lambda user: _check_email(user) or _check_telephone(user))
 
     def validate_emails(self):
         # Validate email addresses in the users data.
         # Returns: None
-        new_users = []
-        for user in self.users:
-            try:
-                if user[2]:
-                    at_count = user[2].count('@')
-                    dot_count = user[2].count('.')
-                    if at_count == 1 and dot_count == 1:
-                        email_parts = user[2].split('@')
-                        username = email_parts[0]
-                        domain_parts = email_parts[1].split('.')
-                        domain = domain_parts[0]
-                        topdomain = domain_parts[1]
-
-                        if len(username) >= 1 and len(domain) >= 1 and 1 <= len(topdomain) <= 4:
-                            if topdomain.isalnum():
-                                new_users.append(user)
-            except Exception as e:
-                print(f'Error validating email: {e}')
-
-        self.users = new_users
+        with self.profile_stage('validate_emails'):
+            self._filter_users(_check_email)
 
     def validate_telephone(self):
         # Validate telephone numbers in the users data.
         # Returns: None
-        new_users = []
-        for user in self.users:
-            try:
-                if user[1]:
-                    if user[1].isnumeric() and len(user[1]) == 9:
-                        new_users.append(user)
-                    else:
-                        user[1] = user[1].replace(' ', '')
-                        user[1] = user[1][len(user[1]) - 9:]
-                        new_users.append(user)
-            except Exception as e:
-                print(f'Error validating telephone number: {e}')
+        with self.profile_stage('validate_telephone'):
+            self._filter_users(_check_telephone)
 
-        self.users = new_users
+    def write_rejection_report(self, file):
+        # Write rejected users counts by reason and samples of rejected users as JSON.
+        # Parameters: file (str): The path to the report file.
+        # Returns: None
+        import json
+
+        report = {
+            'rejected': sum(self.rejections.values()),
+            'reasons': dict(self.rejections),
+            'samples': self._rejection_samples,
+        }
+        with open(file, 'w') as f:
+            json.dump(report, f, indent=2)
 
     def remove_duplicates(self):
         # This function removes duplicate numbers first.
         # If an account has a duplicated number AND email with another account 
         # then it will first select the newer user with the same number
         # Returns: None
-        seen_numbers = {}
-        unique_users = []
-
-        for user in self.users:
-            first_name, telephone_number, email, _, _, created_at, _ = user
-            timestamp = datetime.strptime(created_at, '%Y-%m-%d %H:%M:%S')
-
-            # Check if number was seen
-            if telephone_number in seen_numbers:
-                existing_timestamp = seen_numbers[telephone_number]
-                if timestamp > existing_timestamp:
-                    # Actualize timestamp
-                    seen_numbers[telephone_number] = timestamp
-                    # Actualize account to newer one
-                    unique_users = [u for u in unique_users if u[1] != telephone_number]
-                    unique_users.append(user)
-            else:
-                seen_numbers[telephone_number] = timestamp
-                unique_users.append(user)
-        
-        self.users = unique_users
-
-        seen_emails = {}
-        unique_users = []
-
-        for user in self.users:
-            first_name, telephone_number, email, _, _, created_at, _ = user
-            timestamp = datetime.strptime(created_at, '%Y-%m-%d %H:%M:%S')
-
-            # Check if email was seen
-            if email in seen_emails:
-                existing_timestamp = seen_emails[email]
-                if timestamp > existing_timestamp:
-                    # Actualize timestamp
-                    seen_emails[email] = timestamp
-                    # Actualize account to newer one
-                    unique_users = [u for u in unique_users if u[2] != email]
-                    unique_users.append(user)
-            else:
-                seen_emails[email] = timestamp
-                unique_users.append(user)
-        
-        self.users = unique_users
+        with self.profile_stage('remove_duplicates'):
+            previous_users = self.users
+            number_winners = _newest_by(previous_users, 'telephone_number')
+            self.users = list(_newest_by(number_winners.values(), 'email').values())
+            self._rebuild_indexes(previous_users)
+
+    def run_command(self, command, login, password, sync=False, shards=1,
+                    count=10, since=None, until=None, period='day', tolerance=0, output=None):
+        # Run a CLI command and print its result.
+        # Parameters: command (str): Command name (e.g. print-children),
+        # login (str): telephone number or email, password (str),
+        # sync (bool): create_database updates only changed rows,
+        # shards (int): create_database partitions users into this many files in SHARDED_DATABASE_DIRECTORY,
+        # count (int): Number of accounts of print-oldest-accounts / print-newest-accounts,
+        # since (str), until (str): Time window of print-accounts-created / count-signups (until excluded),
+        # period (str): 'day' or 'month' signup counts of count-signups,
+        # tolerance (int): Children ages differing by up to this many years are similar in similar-children-report,
+        # output (OutputWriter): Writer of the results, the caller closes it (results are printed if None).
+        # Returns: None
+        previous_output = self.output
+        if output is not None:
+            self.output = output
+        try:
+            with self.profile_stage(f'command:{command}'):
+                if command == 'print-all-accounts':
+                    self.print_all_accounts(login, password)
+                elif command == 'print-oldest-account':
+                    self.print_oldest_account(login, password)
+                elif command == 'print-oldest-accounts':
+                    self.print_oldest_accounts(login, password, count)
+                elif command == 'print-newest-accounts':
+                    self.print_newest_accounts(login, password, count)
+                elif command == 'print-accounts-created':
+                    self.print_accounts_created(login, password, since, until)
+                elif command == 'count-signups':
+                    self.print_signup_counts(login, password, period, since, until)
+                elif command == 'group-by-age':
+                    self.group_by_age(login, password)
+                elif command == 'print-children':
+                    self.print_children(login, password)
+                elif command == 'find-similar-children-by-age':
+                    self.find_similar_children_by_age(login, password)
+                elif command == 'similar-children-report':
+                    self.print_similar_children_report(login, password, tolerance)
+                elif command == 'create_database' and shards > 1:
+                    self.create_database(login, password, sync=sync, database_file=SHARDED_DATABASE_DIRECTORY, shards=shards)
+                elif command == 'create_database':
+                    self.create_database(login, password, sync=sync)
+                else:
+                    self._write_error('Invalid command')
+        finally:
+            self.output = previous_output
+
+    def _write(self, text, record=None, encoded=None):
+        # Write one command result to the output writer, or print it without one.
+        # Parameters: text (str): The result as text, record (dict): The result for JSON output formats,
+        # encoded (str): The result already encoded as JSON.
+        # Returns: more (bool): False once no more results are written, so the command can stop early.
+        if self.output is None:
+            print(text)
+            return True
+        return self.output.write(text, record, encoded)
+
+    def _write_error(self, text):
+        # Write an error message (failed authentication, missing permission),
+        # limit and offset of the output writer do not apply to it.
+        # Returns: None
+        if self.output is None:
+            print(text)
+        else:
+            self.output.write_error(text)
 
     def authenticate_user(self, login, password):
         # Authenticate a user based on login (telephone number or email) and password.
         # Parameters: login (str): telephone number or email, password (str).
-        # Returns: user (list): The authenticated user's data if successful / None: If authentication fails.
-        for user in self.users:
-            if user[1] == login or user[2] == login:
-                if user[3] == password:
-                    return user
-                else:
-                    return 'Your password is wrong. Try with double quotes around your password'
+        # Returns: user (User): The authenticated user's data if successful / str: Error message if authentication fails.
+        user = self._login_index.get(login)
+        if user is not None:
+            if user.password == password:
+                return user
+            else:
+                return 'Your password is wrong. Try with double quotes around your password'
         return 'Your login is wrong'
 
+    def _write_oldest_account(self, firstname, email, created_at):
+        # Returns: more (bool): False once no more results are written.
+        return self._write(f'name: {firstname}\nemail_address: {email}\ncreated_at: {created_at}',
+                           {'name': firstname, 'email_address': email, 'created_at': created_at})
+
+    def _write_account(self, firstname, email, created_at):
+        # Returns: more (bool): False once no more results are written.
+        return self._write(f'{firstname}, {email}, {created_at}',
+                           {'firstname': firstname, 'email': email, 'created_at': created_at})
+
+    def _write_age_count(self, age, count):
+        # Returns: more (bool): False once no more results are written.
+        return self._write(f'age: {age}, count: {count}', {'age': age, 'count': count})
+
+    def _write_similar_user(self, firstname, telephone_number, children):
+        # Parameters: children (list): (name, age) of the user's children, sorted by name.
+        # Returns: more (bool): False once no more results are written.
+        children_data = '; '.join(f'{name}, {age}' for name, age in children)
+        return self._write(f'{firstname}, {telephone_number}: {children_data}',
+                           {'firstname': firstname, 'telephone_number': telephone_number,
+                            'children': [{'name': name, 'age': age} for name, age in children]})
+
     def print_all_accounts(self, login, password):
         # Print the total number of accounts if the user is authenticated as an admin.
         # Parameters: login (str): telephone number or email, password (str).
         # Returns: None
         auth_result = self.authenticate_user(login, password)
-        _, _, _, _, role, _, _ = auth_result
-        
-        if isinstance(auth_result, list):
-            if role == 'admin':
-                print(len(self.users))
+
+        if isinstance(auth_result, User):
+            if auth_result.role == 'admin':
+                self._write(str(len(self.users)), {'accounts': len(self.users)})
             else:
-                print(f'You need admin permission, but your role is: {role}')
+                self._write_error(f'You need admin permission, but your role is: {auth_result.role}')
         else:
-            print(auth_result)
+            self._write_error(auth_result)
 
     def print_oldest_account(self, login, password):
         # Print information about the oldest account if the user is authenticated as an admin.
@@ -260,54 +1526,149 @@ class UserDataProcessor:
         # Returns: oldest_user_data (list): Information about the oldest user [name, email_address, created_at] 
         # / None: If authentication fails.
         auth_result = self.authenticate_user(login, password)
-        _, _, _, _, role, _, _ = auth_result
 
-        if isinstance(auth_result, list):
-            if role == 'admin':
-                oldest_user = [None, None, datetime.now()]
+        if isinstance(auth_result, User):
+            if auth_result.role == 'admin':
+                oldest_user = self._oldest_user
+                if oldest_user is not None:
+                    self._write_oldest_account(oldest_user.firstname, oldest_user.email, oldest_user.created_at_text)
+                else:
+                    self._write('No accounts with a creation date.')
+            else:
+                self._write_error(f'You need admin permission, but your role is: {auth_result.role}')
+        else:
+            self._write_error(auth_result)
+
+    def _account_row(self, position):
+        # Returns: account (tuple): firstname, email and created_at text of the user at a position in users data.
+        user = self.users[position]
+        return user.firstname, user.email, user.created_at_text
+
+    def _oldest_accounts(self, count):
+        # Parameters: count (int): Number of accounts.
+        # Returns: accounts (list): (firstname, email, created_at) of the oldest accounts, oldest first.
+        positions = self._get_created_at_index()[1]
+        return [self._account_row(position) for position in positions[:max(count, 0)]]
+
+    def _newest_accounts(self, count):
+        # Parameters: count (int): Number of accounts.
+        # Returns: accounts (list): (firstname, email, created_at) of the newest accounts, newest first.
+        positions = self._get_created_at_index()[1]
+        return [self._account_row(position) for position in positions[:-max(count, 0) - 1:-1]]
+
+    def _accounts_created_between(self, since, until):
+        # Parameters: since (int), until (int): Epochs of the time window (until excluded), None for no bound.
+        # Returns: accounts (list): (firstname, email, created_at) of accounts created in the window, oldest first.
+        created_at_values, positions = self._get_created_at_index()
+        start = 0 if since is None else bisect_left(created_at_values, since)
+        end = len(positions) if until is None else bisect_left(created_at_values, until)
+        return [self._account_row(position) for position in positions[start:end]]
+
+    def _signup_counts(self, period, since, until):
+        # Count signups per period with one binary search per period that has signups.
+        # Parameters: period (str): 'day' or 'month',
+        # since (int), until (int): Epochs of the time window (until excluded), None for no bound.
+        # Returns: counts (list): (period label, number of accounts created in it), in chronological order.
+        created_at_values = self._get_created_at_index()[0]
+        start = 0 if since is None else bisect_left(created_at_values, since)
+        end = len(created_at_values) if until is None else bisect_left(created_at_values, until)
+        counts = []
+        while start < end:
+            label, period_end = _signup_period(created_at_values[start], period)
+            next_start = bisect_left(created_at_values, period_end, start, end)
+            counts.append((label, next_start - start))
+            start = next_start
+        return counts
+
+    def print_oldest_accounts(self, login, password, count=10):
+        # Print the oldest accounts, oldest first, if the user is authenticated as an admin.
+        # Accounts created at the same time are in the order of users data.
+        # Parameters: login (str): telephone number or email, password (str), count (int): Number of accounts.
+        # Returns: None
+        auth_result = self.authenticate_user(login, password)
 
-                for user in self.users:
-                    timestamp = datetime.strptime(user[5], '%Y-%m-%d %H:%M:%S')
+        if isinstance(auth_result, User):
+            if auth_result.role == 'admin':
+                for firstname, email, created_at in self._oldest_accounts(count):
+                    if not self._write_account(firstname, email, created_at):
+                        break
+            else:
+                self._write_error(f'You need admin permission, but your role is: {auth_result.role}')
+        else:
+            self._write_error(auth_result)
 
-                    if oldest_user[2] > timestamp:
-                        oldest_user = [user[0], user[2], timestamp]
-                print('name: ' + oldest_user[0])
-                print('email_address: ' + oldest_user[1])
-                print('created_at: ' + str(oldest_user[2]))
+    def print_newest_accounts(self, login, password, count=10):
+        # Print the newest accounts, newest first, if the user is authenticated as an admin.
+        # Accounts created at the same time are in the reverse order of users data.
+        # Parameters: login (str): telephone number or email, password (str), count (int): Number of accounts.
+        # Returns: None
+        auth_result = self.authenticate_user(login, password)
+
+        if isinstance(auth_result, User):
+            if auth_result.role == 'admin':
+                for firstname, email, created_at in self._newest_accounts(count):
+                    if not self._write_account(firstname, email, created_at):
+                        break
+            else:
+                self._write_error(f'You need admin permission, but your role is: {auth_result.role}')
+        else:
+            self._write_error(auth_result)
+
+    def print_accounts_created(self, login, password, since=None, until=None):
+        # Print accounts created in a time window, oldest first, if the user is authenticated as an admin.
+        # Parameters: login (str): telephone number or email, password (str),
+        # since (str), until (str): YYYY-MM-DD [HH:MM:SS] bounds of the window (until excluded), None for no bound.
+        # Returns: None
+        since, until = parse_time_bound(since), parse_time_bound(until)
+        auth_result = self.authenticate_user(login, password)
+
+        if isinstance(auth_result, User):
+            if auth_result.role == 'admin':
+                for firstname, email, created_at in self._accounts_created_between(since, until):
+                    if not self._write_account(firstname, email, created_at):
+                        break
             else:
-                print(f'You need admin permission, but your role is: {role}')
+                self._write_error(f'You need admin permission, but your role is: {auth_result.role}')
         else:
-            print(auth_result)
+            self._write_error(auth_result)
+
+    def print_signup_counts(self, login, password, period='day', since=None, until=None):
+        # Print the number of accounts created per day or month if the user is authenticated as an admin.
+        # Periods without signups are skipped.
+        # Parameters: login (str): telephone number or email, password (str), period (str): 'day' or 'month',
+        # since (str), until (str): YYYY-MM-DD [HH:MM:SS] bounds of the window (until excluded), None for no bound.
+        # Returns: None
+        if period not in SIGNUP_PERIODS:
+            raise ValueError(f"period must be one of {', '.join(SIGNUP_PERIODS)}, not '{period}'")
+        since, until = parse_time_bound(since), parse_time_bound(until)
+        auth_result = self.authenticate_user(login, password)
+
+        if isinstance(auth_result, User):
+            if auth_result.role == 'admin':
+                for label, count in self._signup_counts(period, since, until):
+                    if not self._write(f'{label}: {count}', {'period': label, 'count': count}):
+                        break
+            else:
+                self._write_error(f'You need admin permission, but your role is: {auth_result.role}')
+        else:
+            self._write_error(auth_result)
 
     def group_by_age(self, login, password):
         # Group users children by age and print the count of children for each age if the user is authenticated as an admin.
         # Parameters: login (str): telephone number or email, password (str).
         # Returns: age_counts (dict): Dictionary with age counts / None: If authentication fails.
         auth_result = self.authenticate_user(login, password)
-        _, _, _, _, role, _, _ = auth_result
-
-        if isinstance(auth_result, list):
-            if role == 'admin':
-                age_counts = {}
-
-                for user in self.users:
-                    if user[6]:
-                        for child in user[6]:
-                            age = child[1]
-
-                            if age in age_counts:
-                                age_counts[age] += 1
-                            else:
-                                age_counts[age] = 1
-                
-                sorted_age_counts = dict(sorted(age_counts.items(), key=lambda item: item[1]))
-
-                for age, count in sorted_age_counts.items():
-                    print(f'age: {age}, count: {count}')
+
+        if isinstance(auth_result, User):
+            if auth_result.role == 'admin':
+                # Counter keeps ages in first seen order, the sort is stable
+                for age, count in sorted(self._age_counts.items(), key=lambda item: item[1]):
+                    if not self._write_age_count(age, count):
+                        break
             else:
-                print(f'You need admin permission, but your role is: {role}')
+                self._write_error(f'You need admin permission, but your role is: {auth_result.role}')
         else:
-            print(auth_result)
+            self._write_error(auth_result)
 
     def print_children(self, login, password):
         # Print children information for the authenticated user.
@@ -315,151 +1676,305 @@ class UserDataProcessor:
         # Returns: None
         auth_result = self.authenticate_user(login, password)
 
-        if isinstance(auth_result, list):
-            _, _, _, _, _, _, children = auth_result
+        if isinstance(auth_result, User):
+            children = auth_result.children
 
             try:
                 if children:
                     for child in children:
-                        print(f'{child[0]}, {child[1]}')
+                        if not self._write(f'{child.name}, {child.age}', {'name': child.name, 'age': child.age}):
+                            break
             except Exception as e:
-                print(f'Error printing children: {e}')
+                self._write_error(f'Error printing children: {e}')
         else:
-            print(auth_result)   
+            self._write_error(auth_result)
 
     def find_similar_children_by_age(self, login, password):
         # Find and print users with similar children by age for the authenticated user.
         # Parameters: login (str): telephone number or email, password (str).
         # Returns: None
         auth_result = self.authenticate_user(login, password)
-        if isinstance(auth_result, list):
-            _, _, _, _, _, _, children = auth_result
+        if isinstance(auth_result, User):
+            children = auth_result.children
             children_age = []
 
             if children:
             # Get age of children
                 try:
                     for child in children:
-                        children_age.append(child[1])
+                        children_age.append(child.age)
                 except Exception as e:
-                    print(f'Error finding similar children: {e}')
-
-                # Find children with similar age
-                similar_children_data = []
-                for user in self.users:
-                    try:
-                        if user[6]:
-                            for child in user[6]:
-                                for user_child in children_age:
-                                    if user_child == child[1]:
-                                        similar_children_data.append(user)
-                    except Exception as e:
-                        print(f'Error finding similar children: {e}')
-
-                # Removing same users
-                unique_users = []
-                for user in similar_children_data:
-                    if user not in unique_users:
-                        unique_users.append(user)
-
-                # Sort children alphabetically
-                for user in unique_users:
-                    user[6].sort(key=lambda x: x[0], reverse=False)
-
-                # Extract data to display
-                display_data = []
-                for user in unique_users:
-                    base_string = f'{user[0]}, {user[1]}:'
-                    for child in user[6]:
-                        base_string += f' {child[0]}, {child[1]};'
-                    base_string = base_string[:-1]
-                    display_data.append(base_string)
-
-                for row in display_data:
-                    print(row)
+                    self._write_error(f'Error finding similar children: {e}')
+
+                # Find users with children of the same age, in users data order
+                age_index = self._get_age_index()
+                positions = set()
+                for age in set(children_age):
+                    positions.update(age_index.get(age, ()))
+
+                # Extract data to display, children sorted alphabetically
+                for position in sorted(positions):
+                    user = self.users[position]
+                    if not self._write_similar_user(user.firstname, user.telephone_number, self._get_sorted_children(position)):
+                        break
 
             else:
-                print('No children data available for the authenticated user.')
+                self._write('No children data available for the authenticated user.')
 
         else:
-            print(auth_result)
+            self._write_error(auth_result)
+
+    def _parents_children_ages(self):
+        # Returns: parents (list): (firstname, telephone_number, email, ages) of users with children
+        # in users data order, ages of their children sorted without repeats.
+        return [(user.firstname, user.telephone_number, user.email, sorted({child.age for child in user.children}))
+                for user in self.users if user.children]
+
+    def _similar_children_report(self, tolerance=0):
+        # Find similar parents of every parent with one join within children age buckets:
+        # parents are bucketed by children age once, the buckets within tolerance of every age
+        # are found with a sliding window over the sorted ages and merged for each parent.
+        # Similar parents are the users find_similar_children_by_age prints for the parent
+        # (the parent included) when tolerance is 0.
+        # Parameters: tolerance (int): Children ages differing by up to this many years are similar.
+        # Returns: lines (generator): JSON line of every parent, in users data order.
+        import json
+
+        parents = self._parents_children_ages()
+        buckets = {}
+        for index, parent in enumerate(parents):
+            for age in parent[3]:
+                buckets.setdefault(age, []).append(index)
+
+        # Sliding window: ages within tolerance of every age
+        ages = sorted(buckets)
+        windows = {}
+        low = high = 0
+        for age in ages:
+            while ages[low] < age - tolerance:
+                low += 1
+            while high < len(ages) and ages[high] <= age + tolerance:
+                high += 1
+            windows[age] = ages[low:high]
+
+        emails = [json.dumps(parent[2]) for parent in parents]
+        # Similar parents of a single age are shared by all parents with children of that age only
+        similar_by_age = {}
+        for firstname, telephone_number, email, parent_ages in parents:
+            if len(parent_ages) == 1 and parent_ages[0] in similar_by_age:
+                similar = similar_by_age[parent_ages[0]]
+            else:
+                window_ages = sorted({age for parent_age in parent_ages for age in windows[parent_age]})
+                indexes = heapq.merge(*(buckets[age] for age in window_ages))
+                similar = '[' + ', '.join(emails[index] for index, _ in groupby(indexes)) + ']'
+                if len(parent_ages) == 1:
+                    similar_by_age[parent_ages[0]] = similar
+            parent = json.dumps({'firstname': firstname, 'telephone_number': telephone_number,
+                                 'email': email, 'children_ages': parent_ages})
+            yield parent[:-1] + ', "similar": ' + similar + '}'
+
+    def print_similar_children_report(self, login, password, tolerance=0):
+        # Print similar parents of every parent as NDJSON if the user is authenticated as an admin:
+        # {"firstname": ..., "telephone_number": ..., "email": ..., "children_ages": [...], "similar": [emails]}
+        # Parameters: login (str): telephone number or email, password (str),
+        # tolerance (int): Children ages differing by up to this many years are similar.
+        # Returns: None
+        if tolerance < 0:
+            raise ValueError(f'tolerance must not be negative, not {tolerance}')
+        auth_result = self.authenticate_user(login, password)
+
+        if isinstance(auth_result, User):
+            if auth_result.role == 'admin':
+                for line in self._similar_children_report(tolerance):
+                    if not self._write(line, encoded=line):
+                        break
+            else:
+                self._write_error(f'You need admin permission, but your role is: {auth_result.role}')
+        else:
+            self._write_error(auth_result)
 
-    def create_database(self, login, password):
+    def create_database(self, login, password, sync=False, database_file='users_database.db', shards=1):
         # Create a SQLite database with users and children tables 
         # if the user is authenticated as an admin.
-        # Parameters: login (str): telephone number or email, password (str).
+        # Parameters: login (str): telephone number or email, password (str),
+        # sync (bool): Update only changed rows of an existing database instead of rewriting it,
+        # database_file (str): The path to the SQLite database file (the folder of a sharded database),
+        # shards (int): Number of SQLite files users are partitioned into by email.
         # Returns: None
         auth_result = self.authenticate_user(login, password)
 
-        if isinstance(auth_result, list):
-            _, _, _, _, role, _, _ = auth_result
+        if isinstance(auth_result, User):
+            role = auth_result.role
+
+            if role == 'admin' and shards > 1:
+                self._write_shards(database_file, shards, sync)
+
+                if sync:
+                    self._write('Database synchronized successfully.')
+                else:
+                    self._write('Database created successfully.')
+            elif role == 'admin':
+                import sqlite3
 
-            if role == 'admin':
-                conn = sqlite3.connect('users_database.db')
+                conn = sqlite3.connect(database_file, isolation_level=None)
                 cursor = conn.cursor()
 
+                # WAL lets readers keep reading while the database is written
+                cursor.execute('PRAGMA journal_mode=WAL')
+                cursor.execute('PRAGMA synchronous=NORMAL')
+
                 # Create users table
-                create_users_table_query = '''
-                    CREATE TABLE IF NOT EXISTS users (
-                        id INTEGER PRIMARY KEY AUTOINCREMENT,
-                        firstname TEXT,
-                        telephone_number TEXT,
-                        email TEXT,
-                        password TEXT,
-                        role TEXT,
-                        created_at TEXT
-                    )
-                '''
-                cursor.execute(create_users_table_query)
+                cursor.execute(CREATE_USERS_TABLE_QUERY)
 
                  # Create children table
-                create_children_table_query = '''
-                    CREATE TABLE IF NOT EXISTS children (
-                        id INTEGER PRIMARY KEY AUTOINCREMENT,
-                        parent_email TEXT,
-                        name TEXT,
-                        age INTEGER,
-                        FOREIGN KEY (parent_email) REFERENCES users (email)
-                    )
-                '''
-                cursor.execute(create_children_table_query)
-
-                users_data = []
-                for user in self.users:
-                    users_data.append(tuple(user[:6]))
-
-                # Delete users
-                delete_users_query = 'DELETE FROM users'
-                cursor.execute(delete_users_query)
-
-                # Insert users
-                insert_users_query = 'INSERT INTO users (firstname, telephone_number, email, password, role, created_at) VALUES (?, ?, ?, ?, ?, ?)'
-                cursor.executemany(insert_users_query, users_data)
-
-                children_data_array = []
-                for user in self.users:
-                    try:
-                        if user[6]:
-                            for child in user[6]:
-                                children_data_array.append([user[2], child[0], child[1]])
-                    except Exception as e:
-                        print(f'Error creating database: {e}')
-                
-                children_data = [tuple(user[:3]) for user in children_data_array]
-
-                # Delete children
-                delete_children_query = 'DELETE FROM children'
-                cursor.execute(delete_children_query)
-
-                # Insert children
-                insert_children_query = 'INSERT INTO children (parent_email, name, age) VALUES (?, ?, ?)'
-                cursor.executemany(insert_children_query, children_data)
-
-                conn.commit()
-                conn.close()
-
-                print('Database created successfully.')
+                cursor.execute(CREATE_CHILDREN_TABLE_QUERY)
+
+                # Write everything in one transaction
+                cursor.execute('BEGIN')
+                try:
+                    if sync:
+                        self._sync_database(cursor)
+                    else:
+                        self._rewrite_database(cursor)
+                    cursor.execute('COMMIT')
+                except Exception:
+                    cursor.execute('ROLLBACK')
+                    raise
+                finally:
+                    conn.close()
+
+                if sync:
+                    self._write('Database synchronized successfully.')
+                else:
+                    self._write('Database created successfully.')
             else:
-                print(f'You need admin permission, but your role is: {role}')
+                self._write_error(f'You need admin permission, but your role is: {role}')
         else:
-            print(auth_result)
\ No newline at end of file
+            self._write_error(auth_result)
+
+    def _write_shards(self, directory, shards, sync=False):
+        # Partition the users data by email into shard files written in parallel.
+        # Users and children keep their position in the users data as id.
+        # Parameters: directory (str): The path to the sharded database folder,
+        # shards (int): Number of shards, sync (bool): Rewrite only shards whose rows changed.
+        # Returns: written (list): For every shard, whether it was written.
+        from concurrent.futures import ThreadPoolExecutor
+
+        shard_users = [[] for shard in range(shards)]
+        shard_children = [[] for shard in range(shards)]
+        child_id = 0
+        for user_id, user in enumerate(self.users, 1):
+            shard = shard_of(user.email, shards)
+            shard_users[shard].append((user_id,) + user.to_row())
+            for child in user.children:
+                child_id += 1
+                shard_children[shard].append((child_id, user.email, child.name, child.age))
+
+        os.makedirs(directory, exist_ok=True)
+        files = [os.path.join(directory, SHARD_FILE_PATTERN.format(shard)) for shard in range(shards)]
+        # SQLite releases the GIL while it writes, so shards are written concurrently
+        with ThreadPoolExecutor(max_workers=shards) as executor:
+            written = list(executor.map(_write_shard, files, shard_users, shard_children, [sync] * shards))
+
+        # Remove shards left over from a layout with more shards
+        for file in shard_files(directory)[shards:]:
+            for suffix in ('', '-wal', '-shm'):
+                if os.path.exists(file + suffix):
+                    os.remove(file + suffix)
+        return written
+
+    def _rewrite_database(self, cursor):
+        # Replace all rows of the users and children tables with the users data.
+        # Indexes are dropped for the bulk insert and built once at the end.
+        # Parameters: cursor (sqlite3.Cursor): Cursor inside a transaction.
+        # Returns: None
+        for drop_index_query in DROP_INDEX_QUERIES:
+            cursor.execute(drop_index_query)
+
+        # Delete users
+        delete_users_query = 'DELETE FROM users'
+        cursor.execute(delete_users_query)
+
+        # Insert users
+        insert_users_query = 'INSERT INTO users (firstname, telephone_number, email, password, role, created_at) VALUES (?, ?, ?, ?, ?, ?)'
+        cursor.executemany(insert_users_query, (user.to_row() for user in self.users))
+
+        # Delete children
+        delete_children_query = 'DELETE FROM children'
+        cursor.execute(delete_children_query)
+
+        # Insert children
+        insert_children_query = 'INSERT INTO children (parent_email, name, age) VALUES (?, ?, ?)'
+        children_data = ((user.email, child.name, child.age) for user in self.users for child in user.children)
+        cursor.executemany(insert_children_query, children_data)
+
+        for create_index_query in CREATE_INDEX_QUERIES:
+            cursor.execute(create_index_query)
+
+    def _sync_database(self, cursor):
+        # Update the users and children tables to match the users data, keyed by email.
+        # Only changed users and children are written and users which disappeared are deleted.
+        # A database keeps one row per email (the first user with that email wins).
+        # Parameters: cursor (sqlite3.Cursor): Cursor inside a transaction.
+        # Returns: None
+        for create_index_query in CREATE_INDEX_QUERIES:
+            cursor.execute(create_index_query)
+
+        # Current rows: email -> (id, row) and parent email -> children
+        stored_users = {}
+        duplicated_ids = []
+        res = cursor.execute('SELECT id, firstname, telephone_number, email, password, role, created_at FROM users ORDER BY id')
+        while True:
+            data = res.fetchmany(DB_FETCH_SIZE)
+            if not data:
+                break
+            for row in data:
+                if row[3] in stored_users:
+                    duplicated_ids.append((row[0],))
+                else:
+                    stored_users[row[3]] = (row[0], row[1:])
+
+        stored_children = {}
+        res = cursor.execute('SELECT parent_email, name, age FROM children ORDER BY id')
+        while True:
+            data = res.fetchmany(DB_FETCH_SIZE)
+            if not data:
+                break
+            for parent_email, name, age in data:
+                stored_children.setdefault(parent_email, []).append((name, age))
+
+        insert_users = []
+        update_users = []
+        changed_children = []
+        emails = set()
+        for user in self.users:
+            if user.email in emails:
+                continue
+            emails.add(user.email)
+
+            row = user.to_row()
+            stored_user = stored_users.get(user.email)
+            if stored_user is None:
+                insert_users.append(row)
+            elif stored_user[1] != row:
+                update_users.append(row + (stored_user[0],))
+
+            children = [(child.name, child.age) for child in user.children]
+            if stored_children.get(user.email, []) != children:
+                changed_children.append((user.email, children))
+
+        deleted_users = [(stored_user[0],) for email, stored_user in stored_users.items() if email not in emails]
+        deleted_children = [(email,) for email in stored_children if email not in emails]
+
+        # Delete users which disappeared and their children
+        cursor.executemany('DELETE FROM users WHERE id = ?', deleted_users + duplicated_ids)
+        cursor.executemany('DELETE FROM children WHERE parent_email = ?', deleted_children)
+
+        # Upsert changed users
+        cursor.executemany('UPDATE users SET firstname = ?, telephone_number = ?, email = ?, password = ?, role = ?, created_at = ? WHERE id = ?', update_users)
+        cursor.executemany('INSERT INTO users (firstname, telephone_number, email, password, role, created_at) VALUES (?, ?, ?, ?, ?, ?)', insert_users)
+
+        # Replace children of users whose children changed
+        cursor.executemany('DELETE FROM children WHERE parent_email = ?', [(email,) for email, _ in changed_children])
+        children_data = ((email, name, age) for email, children in changed_children for name, age in children)
+        cursor.executemany('INSERT INTO children (parent_email, name, age) VALUES (?, ?, ?)', children_data)
@@ -0,0 +1,119 @@
+import os
+import json
+import socket
+import asyncio
+from io import StringIO
+from contextlib import redirect_stdout
+from OutputWriter import OutputWriter
+
+class UserDataServer:
+    # Keep a UserDataProcessor resident and answer commands sent over a Unix socket.
+    # A request is one JSON line {"command", "login", "password", "sync", "options", "output_options"},
+    # the response is the command output.
+    def __init__(self, data_processor, socket_path, reload=None, reload_interval=1.0):
+        # Parameters: data_processor (UserDataProcessor): Processor with loaded users data,
+        # socket_path (str): The path to the Unix socket,
+        # reload (function): Called periodically to refresh users data when data files change,
+        # a coroutine function is awaited before the next call,
+        # reload_interval (float): Seconds between reload calls.
+        self.data_processor = data_processor
+        self.socket_path = socket_path
+        self.reload = reload
+        self.reload_interval = reload_interval
+        self._loop = None
+        self._stopped = None
+
+    def run(self):
+        # Serve commands until stop() is called.
+        # Returns: None
+        asyncio.run(self.serve())
+
+    def stop(self):
+        # Stop serving, can be called from another thread.
+        # Returns: None
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._stopped.set)
+
+    async def serve(self):
+        # Serve commands until stop() is called.
+        # Returns: None
+        self._loop = asyncio.get_running_loop()
+        self._stopped = asyncio.Event()
+
+        # Remove a socket left by a previous server
+        if os.path.exists(self.socket_path):
+            os.remove(self.socket_path)
+
+        server = await asyncio.start_unix_server(self._handle, path=self.socket_path)
+        reload_task = None
+        if self.reload is not None:
+            reload_task = asyncio.create_task(self._reload_periodically())
+        try:
+            async with server:
+                await self._stopped.wait()
+        finally:
+            if reload_task is not None:
+                reload_task.cancel()
+            if os.path.exists(self.socket_path):
+                os.remove(self.socket_path)
+
+    async def _reload_periodically(self):
+        # Refresh users data every `reload_interval` seconds.
+        # Commands run on the same event loop, so they never see a half-reloaded state.
+        # Returns: None
+        while True:
+            await asyncio.sleep(self.reload_interval)
+            try:
+                result = self.reload()
+                if asyncio.iscoroutine(result):
+                    await result
+            except Exception as e:
+                print(f'Error reloading data: {e}')
+
+    async def _handle(self, reader, writer):
+        # Run one command request and send back its output.
+        # Parameters: reader (asyncio.StreamReader), writer (asyncio.StreamWriter).
+        # Returns: None
+        line = await reader.readline()
+
+        # Nothing is awaited while stdout is redirected, so outputs never mix
+        output = StringIO()
+        with redirect_stdout(output):
+            try:
+                request = json.loads(line)
+                output_writer = OutputWriter(output, **request.get('output_options', {}))
+                try:
+                    self.data_processor.run_command(request['command'], request['login'],
+                                                    request['password'], sync=request.get('sync', False),
+                                                    output=output_writer, **request.get('options', {}))
+                finally:
+                    output_writer.close()
+            except Exception as e:
+                print(f'Error: {e}')
+        writer.write(output.getvalue().encode())
+        try:
+            await writer.drain()
+        finally:
+            writer.close()
+
+def send_command(socket_path, command, login, password, sync=False, options=None, output_options=None):
+    # Send a command to a running UserDataServer.
+    # Parameters: socket_path (str): The path to the Unix socket, command (str): Command name,
+    # login (str): telephone number or email, password (str),
+    # sync (bool): create_database updates only changed rows,
+    # options (dict): Other run_command arguments (count, since, until, period, tolerance),
+    # output_options (dict): OutputWriter arguments (output_format, limit, offset).
+    # Returns: output (str): The command output.
+    request = {'command': command, 'login': login, 'password': password, 'sync': sync,
+               'options': options or {}, 'output_options': output_options or {}}
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as client:
+        client.connect(socket_path)
+        client.sendall(json.dumps(request).encode() + b'\n')
+        client.shutdown(socket.SHUT_WR)
+        chunks = []
+        while True:
+            chunk = client.recv(65536)
+            if not chunk:
+                break
+            chunks.append(chunk)
+    return b''.join(chunks).decode()
@@ -0,0 +1,248 @@
+import argparse
+import os
+import sys
+import json
+import time
+import shutil
+import platform
+import resource
+import tempfile
+import tracemalloc
+from datetime import datetime
+from contextlib import redirect_stdout
+from UserDataProcessor import UserDataProcessor
+from UserDataGenerator import UserDataGenerator, ADMIN_LOGIN, ADMIN_PASSWORD
+
+DEFAULT_SIZES = [10000, 100000]
+
+FORMATS = ['json', 'csv', 'xml', 'db']
+
+# Stages faster than this are too noisy to compare between runs
+MIN_COMPARED_SECONDS = 0.01
+# Memory growth compared between runs, growth below MIN_COMPARED_MB counts as MIN_COMPARED_MB
+MEMORY_METRICS = ['peak_rss_growth_mb', 'peak_traced_growth_mb']
+MIN_COMPARED_MB = 1.0
+
+COMMANDS = ['print-all-accounts', 'print-oldest-account', 'group-by-age',
+            'print-children', 'find-similar-children-by-age']
+
+class LineCounter:
+    # Output stream counting printed lines instead of keeping them.
+    def __init__(self):
+        self.lines = 0
+
+    def write(self, text):
+        self.lines += text.count('\n')
+        return len(text)
+
+    def flush(self):
+        pass
+
+def process_peak_rss_mb():
+    # Returns: peak (float): Peak resident memory of the whole process so far in MB
+    # (a high-water mark, it includes all earlier stages).
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    if sys.platform == 'darwin':
+        return peak / 1024 / 1024
+    return peak / 1024
+
+def reset_peak_rss():
+    # Reset the peak resident memory reported by rss_mb, so it covers one stage (Linux only).
+    # Returns: reset (bool): True if the peak was reset.
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+        return True
+    except OSError:
+        return False
+
+def rss_mb():
+    # Returns: rss (float): Resident memory of the process in MB, None if unknown,
+    # peak (float): Peak resident memory since reset_peak_rss in MB, None if unknown.
+    try:
+        with open('/proc/self/status') as f:
+            fields = dict(line.split(':', 1) for line in f if ':' in line)
+        return int(fields['VmRSS'].split()[0]) / 1024, int(fields['VmHWM'].split()[0]) / 1024
+    except (OSError, KeyError, ValueError):
+        return None, None
+
+def measure(stages, stage, records, function, *args, **kwargs):
+    # Run one stage and append its timing and memory use to stages.
+    # Memory growth is the stage peak over the memory held when the stage started,
+    # so a stage keeping more data does not show up as a regression of later stages.
+    # Parameters: stages (list): Collected stage results, stage (str): Stage name,
+    # records (int): Number of records the stage processes, None if the function returns it,
+    # function (function): The stage.
+    # Returns: result: The result of the function.
+    tracing = tracemalloc.is_tracing()
+    if tracing:
+        tracemalloc.reset_peak()
+        traced_start = tracemalloc.get_traced_memory()[0]
+    peak_reset = reset_peak_rss()
+    rss_start = rss_mb()[0]
+    start = time.perf_counter()
+    result = function(*args, **kwargs)
+    seconds = time.perf_counter() - start
+    if records is None:
+        records = result
+
+    timing = {
+        'stage': stage,
+        'seconds': round(seconds, 6),
+        'records': records,
+        'records_per_second': round(records / seconds) if seconds else None,
+        'process_peak_rss_mb': round(process_peak_rss_mb(), 1)
+    }
+    rss, peak_rss = rss_mb()
+    if rss is not None:
+        timing['rss_mb'] = round(rss, 1)
+    if peak_reset and peak_rss is not None:
+        timing['stage_peak_rss_mb'] = round(peak_rss, 1)
+        timing['peak_rss_growth_mb'] = round(peak_rss - rss_start, 1)
+    if tracing:
+        peak_traced = tracemalloc.get_traced_memory()[1]
+        timing['peak_traced_mb'] = round(peak_traced / 1024 / 1024, 1)
+        timing['peak_traced_growth_mb'] = round((peak_traced - traced_start) / 1024 / 1024, 1)
+    stages.append(timing)
+    print(f"  {stage:<40} {seconds:10.3f} s {timing['records_per_second'] or 0:>12} records/s", file=sys.stderr)
+    return result
+
+def import_file(data_processor, file):
+    # Returns: records (int): Number of users loaded from the file.
+    before = len(data_processor.users)
+    data_processor.import_data([file])
+    return len(data_processor.users) - before
+
+def generate_dataset(directory, size, formats, seed, duplicate_rate, invalid_rate):
+    # Generate one data file per format, the users are split evenly between them.
+    # Parameters: directory (str): Directory of the data files, size (int): Number of users,
+    # formats (list): File extensions, seed (int), duplicate_rate (float), invalid_rate (float).
+    # Returns: files (list): The paths to the data files, generator (UserDataGenerator).
+    generator = UserDataGenerator(seed, duplicate_rate, invalid_rate)
+    files = []
+    for index, extension in enumerate(formats):
+        count = size // len(formats) + (1 if index < size % len(formats) else 0)
+        file = os.path.join(directory, f'users_{size}.{extension}')
+        generator.write_file(file, count)
+        files.append(file)
+    return files, generator
+
+def run_benchmark(directory, size, formats, seed, duplicate_rate, invalid_rate):
+    # Generate a dataset and time every processing stage on it.
+    # Returns: run (dict): Dataset description and stage timings.
+    print(f'{size} users', file=sys.stderr)
+    start = time.perf_counter()
+    files, generator = generate_dataset(directory, size, formats, seed, duplicate_rate, invalid_rate)
+    run = {
+        'users': size,
+        'duplicates': generator.duplicates,
+        'invalid': generator.invalid,
+        'generate_seconds': round(time.perf_counter() - start, 6),
+        'files': {os.path.basename(file): os.path.getsize(file) for file in files},
+        'stages': []
+    }
+    stages = run['stages']
+
+    data_processor = UserDataProcessor()
+    for file in files:
+        measure(stages, f'import_data[{file.rsplit(".", 1)[1]}]', None, import_file, data_processor, file)
+
+    measure(stages, 'validate_emails', len(data_processor.users), data_processor.validate_emails)
+    measure(stages, 'validate_telephone', len(data_processor.users), data_processor.validate_telephone)
+    measure(stages, 'remove_duplicates', len(data_processor.users), data_processor.remove_duplicates)
+    run['valid_users'] = len(data_processor.users)
+
+    for command in COMMANDS:
+        output = LineCounter()
+        with redirect_stdout(output):
+            measure(stages, command, len(data_processor.users),
+                    data_processor.run_command, command, ADMIN_LOGIN, ADMIN_PASSWORD)
+        stages[-1]['output_lines'] = output.lines
+
+    database_file = os.path.join(directory, 'benchmark_database.db')
+    with redirect_stdout(LineCounter()):
+        measure(stages, 'create_database', len(data_processor.users),
+                data_processor.create_database, ADMIN_LOGIN, ADMIN_PASSWORD, database_file=database_file)
+    return run
+
+def compare_results(previous, results, threshold):
+    # Print stages that got slower or used more memory than in previous results.
+    # Parameters: previous (dict): Earlier benchmark results, results (dict): Current results,
+    # threshold (float): Allowed slowdown and memory growth, e.g. 0.2 for 20%.
+    # Returns: regressions (int): Number of regressions.
+    previous_runs = {run['users']: run for run in previous['runs']}
+    regressions = 0
+    for run in results['runs']:
+        previous_run = previous_runs.get(run['users'])
+        if previous_run is None:
+            continue
+        previous_stages = {stage['stage']: stage for stage in previous_run['stages']}
+        for stage in run['stages']:
+            previous_stage = previous_stages.get(stage['stage'])
+            if previous_stage is None:
+                continue
+            if previous_stage['seconds'] >= MIN_COMPARED_SECONDS:
+                change = stage['seconds'] / previous_stage['seconds'] - 1
+                if change > threshold:
+                    regressions += 1
+                    print(f"Regression: {run['users']} users {stage['stage']} "
+                          f"{previous_stage['seconds']:.3f} s -> {stage['seconds']:.3f} s (+{change:.0%})")
+            for metric in MEMORY_METRICS:
+                if metric not in stage or metric not in previous_stage:
+                    continue
+                change = max(stage[metric], MIN_COMPARED_MB) / max(previous_stage[metric], MIN_COMPARED_MB) - 1
+                if change > threshold:
+                    regressions += 1
+                    print(f"Regression: {run['users']} users {stage['stage']} {metric} "
+                          f"{previous_stage[metric]:.1f} MB -> {stage[metric]:.1f} MB (+{change:.0%})")
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark users data processing on generated data.')
+    parser.add_argument('--sizes', type=int, nargs='+', default=DEFAULT_SIZES, help='Numbers of users of the generated datasets (e.g. 10000 1000000 5000000)')
+    parser.add_argument('--formats', nargs='+', choices=FORMATS, default=FORMATS, help='Formats of the generated data files')
+    parser.add_argument('--duplicate-rate', type=float, default=0.05, help='Share of users repeating an email or telephone number')
+    parser.add_argument('--invalid-rate', type=float, default=0.05, help='Share of users with a missing or malformed email or telephone number')
+    parser.add_argument('--seed', type=int, default=0, help='Seed of the data generator')
+    parser.add_argument('--directory', help='Directory of the generated data (default: a temporary directory, removed afterwards)')
+    parser.add_argument('--trace-memory', action='store_true', help='Report peak Python memory and its growth in every stage (slows the stages down)')
+    parser.add_argument('--output', default='benchmark_results.json', help='File the JSON results are written to')
+    parser.add_argument('--compare', help='Earlier JSON results to report regressions against')
+    parser.add_argument('--threshold', type=float, default=0.2, help='Slowdown reported as a regression by --compare')
+
+    args = parser.parse_args()
+
+    directory = args.directory or tempfile.mkdtemp(prefix='users_benchmark_')
+    os.makedirs(directory, exist_ok=True)
+    if args.trace_memory:
+        tracemalloc.start()
+
+    results = {
+        'timestamp': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'seed': args.seed,
+        'duplicate_rate': args.duplicate_rate,
+        'invalid_rate': args.invalid_rate,
+        'runs': []
+    }
+    try:
+        for size in args.sizes:
+            results['runs'].append(run_benchmark(directory, size, args.formats, args.seed,
+                                                 args.duplicate_rate, args.invalid_rate))
+    finally:
+        if args.directory is None:
+            shutil.rmtree(directory)
+
+    with open(args.output, 'w') as output:
+        json.dump(results, output, indent=2)
+    print(f'Results written to {args.output}')
+
+    if args.compare:
+        with open(args.compare) as previous:
+            if compare_results(json.load(previous), results, args.threshold):
+                sys.exit(1)
+
+if __name__ == '__main__':
+    main()
@@ -1,69 +1,311 @@
 import argparse
-from UserDataProcessor import UserDataProcessor
+import sys
 import os
+from fnmatch import fnmatch
+from io import StringIO
+from contextlib import redirect_stdout
+from UserDataProcessor import UserDataProcessor, SNAPSHOT_FILE, SIGNUP_PERIODS
+from OutputWriter import OutputWriter, OUTPUT_FORMATS
+# SQLiteUserDataProcessor, UserDataServer, json and cProfile are imported
+# only by the commands and flags using them, to keep start-up fast
 
-os.system('cls' if os.name == 'nt' else 'clear')
+# Extensions of the data files
+DATA_EXTENSIONS = ('.json', '.csv', '.xml', '.db')
 
-def find_files(directory):
-    # Find files in `path` folder and subfolders JSON, CSV, XML
-    # Parameters: directory (string): The path to the root files folder.
-    # Returns: files (list): The paths to all files in `path` folder.
+# Default Unix socket of `serve`
+SOCKET_FILE = 'users_management.sock'
+
+def clear_screen():
+    # Clear the terminal with escape codes instead of spawning `clear`.
+    # Returns: None
+    if sys.stdout.isatty():
+        print('\033[H\033[2J\033[3J', end='', flush=True)
+
+def find_files(directory, include=None, exclude=None):
+    # Find JSON, CSV, XML and DB files in `directory` folder and subfolders,
+    # in the same order as os.walk: files of a folder first, then its subfolders.
+    # Parameters: directory (string): The path to the root files folder,
+    # include (list): Patterns (fnmatch) a file path relative to `directory` must match one of,
+    # exclude (list): Patterns of relative file and folder paths to skip.
+    # Returns: files (list): The paths to all files in `directory` folder.
     files_list = []
-    for root, dirs, files in os.walk(directory):
-        for file in files:
-            if file.endswith(".json") or file.endswith(".csv") or file.endswith(".xml") or file.endswith(".db"):
-                files_list.append(os.path.join(root, file))
+    folders = [(directory, '')]
+    while folders:
+        folder, relative_folder = folders.pop()
+        subfolders = []
+        try:
+            entries = list(os.scandir(folder))
+        except OSError:
+            continue
+        for entry in entries:
+            relative_path = relative_folder + entry.name
+            if exclude and any(fnmatch(relative_path, pattern) for pattern in exclude):
+                continue
+            if entry.is_dir():
+                # Symlinked folders are not followed, as in os.walk
+                if not entry.is_symlink():
+                    subfolders.append((entry.path, relative_path + '/'))
+            elif entry.name.endswith(DATA_EXTENSIONS):
+                if not include or any(fnmatch(relative_path, pattern) for pattern in include):
+                    files_list.append(entry.path)
+        # Visit subfolders depth first in scandir order
+        folders.extend(reversed(subfolders))
 
     if files_list:
         return files_list
     else:
         print("No such files in specified folder.")
 
+def load_data(data_processor, files_list, stream=False, workers=1, memory_budget=None):
+    # Load, validate and deduplicate users data
+    # Parameters: data_processor (UserDataProcessor): The processor to fill,
+    # files_list (list): The paths to the data files,
+    # stream (bool): Process data in one streaming pass,
+    # workers (int): Number of processes parsing data files in parallel,
+    # memory_budget (int): Deduplicate out of core holding at most this many bytes of sort keys.
+    # Returns: None
+    if memory_budget:
+        # Spill sort keys of duplicate detection to temporary files
+        data_processor.import_data_external(files_list, memory_budget=memory_budget)
+    elif stream:
+        # Load, validate and remove duplicates without keeping rejected users
+        data_processor.import_data_stream(files_list)
+    else:
+        # Load data, validating emails and telephone numbers on the fly
+        data_processor.import_data(files_list, workers=workers, validate=True)
+
+        # Remove duplicated phones and emails
+        data_processor.remove_duplicates()
+
+def prepare_data(data_processor, args):
+    # Find, load, validate and deduplicate users data from `data` folder,
+    # reusing the snapshot unless --no-cache is given
+    # Parameters: data_processor (UserDataProcessor): The processor to fill,
+    # args (argparse.Namespace): CLI arguments.
+    # Returns: None
+    # Find all JSON, CSV, XML, DB files in `data` folder
+    with data_processor.profile_stage('discovery') as record:
+        files_list = find_files('data', args.include, args.exclude)
+        record['records_in'] = None
+        record['records_out'] = len(files_list or [])
+    # Kept outside `data` folder, which other systems write to
+    snapshot_file = SNAPSHOT_FILE
+
+    memory_budget = args.memory_budget * 1024 * 1024 if args.memory_budget else None
+    # `serve` re-imports changed files later, which needs the per file state of import_data_incremental
+    incremental = args.command == 'serve'
+    if args.no_cache:
+        if incremental:
+            data_processor.import_data_incremental(files_list, workers=args.workers)
+        else:
+            load_data(data_processor, files_list, stream=args.stream, workers=args.workers, memory_budget=memory_budget)
+        return
+
+    with data_processor.profile_stage('load_snapshot'):
+        loaded = data_processor.load_snapshot(snapshot_file, files_list)
+    if not loaded:
+        if (args.stream and not incremental) or memory_budget:
+            load_data(data_processor, files_list, stream=args.stream, memory_budget=memory_budget)
+        else:
+            # Re-import only data files changed since the snapshot was saved
+            data_processor.import_data_incremental(files_list, workers=args.workers)
+
+        # Save processed data for the next run
+        try:
+            with data_processor.profile_stage('save_snapshot'):
+                data_processor.save_snapshot(snapshot_file, files_list)
+        except OSError as e:
+            print(f'Error saving snapshot: {e}')
+
+def data_reloader(data_processor, args, directory='data'):
+    # Prepare re-importing data files changed while users data stays loaded.
+    # Users data loaded without per file state (a snapshot saved by a --stream run)
+    # is imported incrementally once now, so later reloads parse only changed files.
+    # Changed files are imported between commands, so a command never sees a half-imported state,
+    # the snapshot is written in a thread while commands are answered.
+    # Parameters: data_processor (UserDataProcessor): Processor with loaded users data,
+    # args (argparse.Namespace): CLI arguments, directory (str): The data files folder.
+    # Returns: reload (coroutine function): Re-imports changed files and returns their paths.
+    import asyncio
+
+    if not data_processor.incremental:
+        files_list = find_files(directory, args.include, args.exclude)
+        if files_list:
+            data_processor.import_data_incremental(files_list, workers=args.workers)
+
+    async def reload():
+        # Re-import only data files changed since the last check
+        files_list = find_files(directory, args.include, args.exclude)
+        # A data folder found empty (e.g. while it is being replaced) keeps the loaded users
+        if not files_list:
+            return []
+        changed_files = data_processor.import_data_incremental(files_list)
+        if changed_files and not args.no_cache:
+            # Nothing changes users data until the next reload, which waits for the snapshot
+            await asyncio.get_running_loop().run_in_executor(None, data_processor.save_snapshot,
+                                                             SNAPSHOT_FILE, files_list)
+        return changed_files
+
+    return reload
+
+def serve(data_processor, args):
+    # Keep users data loaded and answer commands sent over a Unix socket,
+    # re-importing data files when they change
+    # Parameters: data_processor (UserDataProcessor): Processor with loaded users data,
+    # args (argparse.Namespace): CLI arguments.
+    # Returns: None
+    from UserDataServer import UserDataServer
+
+    reload = None
+    if not args.database:
+        reload = data_reloader(data_processor, args)
+
+    socket_path = args.socket or SOCKET_FILE
+    server = UserDataServer(data_processor, socket_path, reload=reload)
+    print(f'Serving commands on {socket_path}')
+    try:
+        server.run()
+    except KeyboardInterrupt:
+        pass
+
+def run_batch(data_processor, lines, out):
+    # Run `command login password` lines against the same loaded users data
+    # and write one JSON object per line (NDJSON) with the command output.
+    # Parameters: data_processor (UserDataProcessor): Processor with loaded users data,
+    # lines (iterable): Command lines, the password is the rest of the line,
+    # out (file): Stream the results are written to.
+    # Returns: None
+    import json
+
+    for line_number, line in enumerate(lines, 1):
+        line = line.rstrip('\r\n')
+        if not line.strip():
+            continue
+
+        parts = line.split(None, 2)
+        if len(parts) < 3:
+            result = {'line': line_number, 'error': 'Expected: command login password'}
+        else:
+            command, login, password = parts
+            output = StringIO()
+            with redirect_stdout(output):
+                try:
+                    data_processor.run_command(command, login, password)
+                except Exception as e:
+                    print(f'Error: {e}')
+            result = {'line': line_number, 'command': command, 'login': login,
+                      'output': output.getvalue().splitlines()}
+        out.write(json.dumps(result) + '\n')
+    out.flush()
+
 def main():
     # CLI arguments
     parser = argparse.ArgumentParser(description='Manage user data')
-    parser.add_argument('command', help='Command (possible user commands: print-children, find-similar-children-by-age)')
-    parser.add_argument('--login', required=True, help='User login (email or telephone number)')
-    parser.add_argument('--password', required=True, help='User password')
+    parser.add_argument('command', help='Command (possible user commands: print-children, find-similar-children-by-age; `serve` keeps data loaded for --socket clients; `batch` runs command lines from --input)')
+    parser.add_argument('--login', help='User login (email or telephone number)')
+    parser.add_argument('--password', help='User password')
+    parser.add_argument('--input', default='-', help='File with `command login password` lines for `batch` (default: stdin)')
+    parser.add_argument('--socket', help='Send the command to a `serve` process listening on this Unix socket (or listen on it with `serve`)')
+    parser.add_argument('--stream', action='store_true', help='Load, validate and deduplicate data in one streaming pass')
+    parser.add_argument('--no-cache', action='store_true', help='Process data files without reading or saving the snapshot')
+    parser.add_argument('--sync', action='store_true', help='create_database updates only changed rows of an existing database')
+    parser.add_argument('--database', help='Answer commands with SQL queries against this SQLite database (or folder of database shards) instead of loading `data` folder')
+    parser.add_argument('--shards', type=int, default=1, help='create_database partitions users by email into this many SQLite files in `users_database_shards` folder')
+    parser.add_argument('--rejection-report', help='Write counts and samples of users rejected by validation in this run to this JSON file')
+    parser.add_argument('--memory-budget', type=int, help='Deduplicate data larger than memory, holding at most this many MB of sort keys and spilling the rest to temporary files')
+    parser.add_argument('--workers', type=int, default=1, help='Number of processes parsing data files in parallel (not used with --stream)')
+    parser.add_argument('--profile', action='store_true', help='Write wall time, CPU time, records in / out and peak memory of every stage as JSON to stderr')
+    parser.add_argument('--cprofile', help='Dump cProfile statistics of the run to this file')
+    parser.add_argument('--count', type=int, default=10, help='Number of accounts printed by print-oldest-accounts and print-newest-accounts')
+    parser.add_argument('--since', help='Start of the time window of print-accounts-created and count-signups (YYYY-MM-DD [HH:MM:SS])')
+    parser.add_argument('--until', help='End of the time window of print-accounts-created and count-signups, excluded (YYYY-MM-DD [HH:MM:SS])')
+    parser.add_argument('--period', choices=SIGNUP_PERIODS, default='day', help='Signups counted per day or per month by count-signups')
+    parser.add_argument('--tolerance', type=int, default=0, help='Children ages differing by up to this many years are similar in similar-children-report')
+    parser.add_argument('--format', choices=OUTPUT_FORMATS, default='text', help='Write command results as text lines, a JSON array or NDJSON')
+    parser.add_argument('--limit', type=int, help='Write at most this many command results and stop the command early')
+    parser.add_argument('--offset', type=int, default=0, help='Skip this many command results')
+    parser.add_argument('--include', action='append', help='Load only data files whose path relative to `data` matches this pattern (e.g. "a/*.csv", can be repeated)')
+    parser.add_argument('--exclude', action='append', help='Skip data files and folders whose path relative to `data` matches this pattern (can be repeated)')
     args = parser.parse_args()
+    if args.command not in ('serve', 'batch') and (args.login is None or args.password is None):
+        parser.error('the following arguments are required: --login, --password')
+    # The resident server keeps every data file's users to re-import changed files
+    if args.command == 'serve' and args.memory_budget:
+        parser.error('--memory-budget cannot be used with serve')
+
+    clear_screen()
+
+    # Resident server already has users data loaded
+    if args.socket and args.command != 'serve':
+        from UserDataServer import send_command
+
+        try:
+            options = {'count': args.count, 'since': args.since, 'until': args.until, 'period': args.period,
+                       'tolerance': args.tolerance}
+            output_options = {'output_format': args.format, 'limit': args.limit, 'offset': args.offset}
+            print(send_command(args.socket, args.command, args.login, args.password, sync=args.sync,
+                               options=options, output_options=output_options), end='')
+        except OSError as e:
+            print(f'Error: {e}')
+        return
 
     # Initialize
-    data_processor = UserDataProcessor()
+    if args.database and os.path.isdir(args.database):
+        from ShardedSQLiteUserDataProcessor import ShardedSQLiteUserDataProcessor
+
+        data_processor = ShardedSQLiteUserDataProcessor(args.database)
+    elif args.database:
+        from SQLiteUserDataProcessor import SQLiteUserDataProcessor
+
+        data_processor = SQLiteUserDataProcessor(args.database)
+    else:
+        data_processor = UserDataProcessor()
+
+    if args.profile:
+        data_processor.enable_profiling()
+    profiler = None
+    if args.cprofile:
+        import cProfile
+
+        profiler = cProfile.Profile()
+        profiler.enable()
 
     try:
-        # Find all JSON, CSV, XML, DB files in `data` folder
-        files_list = find_files('data')
-
-        # Load data        
-        data_processor.import_data(files_list)
-    
-        # Validate emails
-        data_processor.validate_emails()
-    
-        # Validate telephone numbers
-        data_processor.validate_telephone()
-    
-        # Remove duplicated phones and emails
-        data_processor.remove_duplicates()
-    
+        # SQL query mode keeps users data in the database
+        if not args.database:
+            prepare_data(data_processor, args)
+
+            if args.rejection_report:
+                data_processor.write_rejection_report(args.rejection_report)
+
         # Perform actions based on commands
-        if args.command == 'print-all-accounts':
-            data_processor.print_all_accounts(args.login, args.password)
-        elif args.command == 'print-oldest-account':
-            data_processor.print_oldest_account(args.login, args.password)
-        elif args.command == 'group-by-age':
-            data_processor.group_by_age(args.login, args.password)
-        elif args.command == 'print-children':
-            data_processor.print_children(args.login, args.password)
-        elif args.command == 'find-similar-children-by-age':
-            data_processor.find_similar_children_by_age(args.login, args.password)
-        elif args.command == 'create_database':
-            data_processor.create_database(args.login, args.password)
+        if args.command == 'serve':
+            serve(data_processor, args)
+        elif args.command == 'batch':
+            if args.input == '-':
+                run_batch(data_processor, sys.stdin, sys.stdout)
+            else:
+                with open(args.input) as lines:
+                    run_batch(data_processor, lines, sys.stdout)
         else:
-            print('Invalid command')
+            output = OutputWriter(sys.stdout, args.format, args.limit, args.offset)
+            try:
+                data_processor.run_command(args.command, args.login, args.password, sync=args.sync, shards=args.shards,
+                                           count=args.count, since=args.since, until=args.until, period=args.period,
+                                           tolerance=args.tolerance, output=output)
+            finally:
+                output.close()
     except Exception as e:
         print(f'Error: {e}')
 
+    if profiler is not None:
+        profiler.disable()
+        profiler.dump_stats(args.cprofile)
+    if args.profile:
+        import json
+
+        print(json.dumps(data_processor.profile_summary()), file=sys.stderr)
+
     del data_processor
 
 if __name__ == '__main__':
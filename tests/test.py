@@ -3,8 +3,57 @@ import sys
 from io import StringIO
 import os
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
-from script import UserDataProcessor
-os.system('cls' if os.name == 'nt' else 'clear')
+from script import UserDataProcessor, run_batch, find_files, data_reloader
+from UserDataProcessor import User, _csv_ranges, _parse_children, DEDUPE_KEY_SIZE, parse_time_bound, parse_created_at, CREATED_AT_FORMAT
+from SQLiteUserDataProcessor import SQLiteUserDataProcessor
+from ShardedSQLiteUserDataProcessor import ShardedSQLiteUserDataProcessor
+from UserDataServer import UserDataServer, send_command
+from OutputWriter import OutputWriter
+from UserDataGenerator import UserDataGenerator, ADMIN_LOGIN, ADMIN_PASSWORD
+from datetime import datetime
+from collections import Counter
+import tempfile
+import shutil
+import sqlite3
+import json
+import threading
+import time
+import argparse
+import asyncio
+import tracemalloc
+import pickle
+import xml.etree.ElementTree as ET
+
+# Records unpickling of SnapshotPayload
+UNPICKLED = []
+
+def mark_unpickled():
+    UNPICKLED.append(True)
+
+class SnapshotPayload:
+    # Pickled object which records being unpickled.
+    def __reduce__(self):
+        return (mark_unpickled, ())
+
+def legacy_remove_duplicates(users):
+    # Reference implementation of the original quadratic remove_duplicates.
+    # Parameters: users (list): Users data.
+    # Returns: users (list): Users data without duplicates.
+    for key in (1, 2):
+        seen = {}
+        unique_users = []
+        for user in users:
+            timestamp = datetime.strptime(user[5], '%Y-%m-%d %H:%M:%S')
+            if user[key] in seen:
+                if timestamp > seen[user[key]]:
+                    seen[user[key]] = timestamp
+                    unique_users = [u for u in unique_users if u[key] != user[key]]
+                    unique_users.append(user)
+            else:
+                seen[user[key]] = timestamp
+                unique_users.append(user)
+        users = unique_users
+    return users
 
 class TestUserDataProcessor(unittest.TestCase):
     def setUp(self):
@@ -193,5 +242,718 @@ class TestUserDataProcessor(unittest.TestCase):
         output = 'Database created successfully.'
         self.assertEqual(printed_value, output, 'Creating database is wrong')
 
+    def test_21_login_index_telephone(self):
+        print('\nAuthentication - normalized telephone number')
+        self.data_processor.import_data({'../data/a/c/users_2.csv'})
+        self.data_processor.validate_telephone()
+        output = self.data_processor.authenticate_user('813868944', 'GW4Ft8zbi&')
+        self.assertEqual(output[0], 'Mark', 'Login index is not updated after telephone validation')
+
+    def test_22_login_index_duplicates(self):
+        print('\nAuthentication - removed duplicate')
+        self.data_processor.import_data({'../data/a/c/users_2.csv'})
+        self.data_processor.validate_emails()
+        self.data_processor.validate_telephone()
+        self.data_processor.remove_duplicates()
+        output = self.data_processor.authenticate_user('matthewdecker@example.com', '2p$v9zPt1+')
+        self.assertEqual(output, 'Your login is wrong', 'Login index is not updated after removing duplicates')
+        output = self.data_processor.authenticate_user('441935720', '2p$v9zPt1+')
+        self.assertEqual(output[2], 'matthewdecker2@example.com', 'Login index is not updated after removing duplicates')
+
+    def test_23_remove_duplicates_matches_legacy(self):
+        print('\nRemove duplicates - same result as legacy implementation')
+        self.data_processor.import_data(sorted(self.test_files))
+        self.data_processor.validate_emails()
+        self.data_processor.validate_telephone()
+        expected = legacy_remove_duplicates(list(self.data_processor.users))
+        self.data_processor.remove_duplicates()
+        self.assertEqual(self.data_processor.users, expected, 'Duplicates are removed differently than before')
+
+        rows = [
+            ['A', '111111111', 'a@example.com', 'x', 'user', '2023-01-01 00:00:00', []],
+            ['B', '222222222', 'a@example.com', 'x', 'user', '2023-01-03 00:00:00', []],
+            ['C', '111111111', 'c@example.com', 'x', 'user', '2023-01-02 00:00:00', []],
+            ['D', '111111111', 'd@example.com', 'x', 'user', '2023-01-02 00:00:00', []],
+            ['E', '333333333', 'c@example.com', 'x', 'user', '2023-01-02 00:00:00', []],
+            ['F', '222222222', 'f@example.com', 'x', 'user', '2023-01-04 00:00:00', []],
+        ]
+        users = [User.from_row(*row) for row in rows]
+        self.data_processor.users = list(users)
+        self.data_processor.remove_duplicates()
+        self.assertEqual(self.data_processor.users, legacy_remove_duplicates(users), 'Duplicates are removed differently than before')
+
+    def test_24_user_record(self):
+        print('\nUser record - parsed created_at and positional access')
+        self.data_processor._load_csv('../data/a/c/users_2.csv')
+        user = self.data_processor.users[0]
+        self.assertEqual(user.created_at, 1692833229, 'created_at is not stored as epoch')
+        self.assertEqual(user.created_at_text, '2023-08-23 23:27:09', 'created_at is not formatted back')
+        self.assertEqual((user.firstname, user[1], user.children[2].name), ('Don', '612660796', 'Judith'), 'User fields are not accessible')
+        self.assertIs(user.role, self.data_processor.users[2].role, 'Roles are not interned')
+
+    def test_25_import_data_stream(self):
+        print('\nStreaming import - same result as separate stages')
+        files = [
+            '../data/a/b/users_1.csv',
+            '../data/a/b/users_1.xml',
+            '../data/a/users.json',
+            '../data/a/c/users_2.csv',
+        ]
+        self.data_processor.import_data(files)
+        self.data_processor.validate_emails()
+        self.data_processor.validate_telephone()
+        self.data_processor.remove_duplicates()
+        stream_processor = UserDataProcessor()
+        stream_processor.import_data_stream(files)
+        self.assertEqual(stream_processor.users, self.data_processor.users, 'Streaming import differs from separate stages')
+        output = stream_processor.authenticate_user('greenmadison@example.net', '&S1XUo94)k')
+        self.assertEqual(output.firstname, 'Kevin', 'Streaming import does not index logins')
+
+    def test_26_import_data_parallel(self):
+        print('\nParallel import - same result as serial import')
+        files = sorted(self.test_files, key=lambda file: not file.endswith('.db'))
+        self.data_processor.import_data(files)
+        parallel_processor = UserDataProcessor()
+        parallel_processor.import_data(files, workers=2)
+        self.assertEqual(parallel_processor.users, self.data_processor.users, 'Parallel import differs from serial import')
+        self.assertIs(parallel_processor.users[0].role, self.data_processor.users[0].role, 'Roles are not interned after parallel import')
+
+    def test_27_load_db_appends(self):
+        print('\nDB data appended to previously loaded data')
+        self.data_processor.import_data(['../data/a/c/users_2.csv', '../users_database.db'])
+        self.assertEqual(len(self.data_processor.users), 104, 'DB data replaced previously loaded data')
+        output = ['Russell', '817730653', 'jwilliams@example.com', '4^8(Oj52C+', 'admin', '2023-05-15 21:57:02', [['Rebecca', 11], ['Christie', 17]]]
+        self.assertEqual(self.data_processor.users[20], output, 'Loaded db data is not appropriate')
+
+    def test_28_find_similar_children_keeps_order(self):
+        print('\nFind similar children by age - children order is kept')
+        self.data_processor.import_data({'../data/a/c/users_2.csv'})
+        self.data_processor.validate_emails()
+        self.data_processor.validate_telephone()
+        self.data_processor.remove_duplicates()
+        captured_output = StringIO()
+        sys.stdout = captured_output
+        self.data_processor.find_similar_children_by_age('greenmadison@example.net', '&S1XUo94)k')
+        self.data_processor.print_children('ashleyhall@example.net', '#0R0UT&yw2')
+        printed_value = captured_output.getvalue().strip()
+        sys.stdout = sys.__stdout__
+        output = 'Kevin, 227397825: Kristin, 14\nCassandra, 088691177: Brittany, 14; Joshua, 1\nJoshua, 1\nBrittany, 14'
+        self.assertEqual(printed_value, output, 'Finding similar children changed children order')
+
+    def test_29_aggregates(self):
+        print('\nAggregates - maintained through import, validation and duplicates removal')
+        self.data_processor.import_data(sorted(self.test_files))
+        self.data_processor.validate_emails()
+        self.data_processor.validate_telephone()
+        self.data_processor.remove_duplicates()
+        users = self.data_processor.users
+        age_counts = Counter(child.age for user in users for child in user.children)
+        self.assertEqual(self.data_processor._age_counts, age_counts, 'Children age counts are wrong')
+        oldest_user = min(users, key=lambda user: user.created_at)
+        self.assertIs(self.data_processor._oldest_user, oldest_user, 'Oldest account is wrong')
+
+    def test_30_snapshot(self):
+        print('\nSnapshot - loaded only for unchanged files')
+        files = ['../data/a/c/users_2.csv', '../data/a/b/users_1.xml']
+        self.data_processor.import_data(files)
+        self.data_processor.validate_emails()
+        self.data_processor.validate_telephone()
+        self.data_processor.remove_duplicates()
+        with tempfile.TemporaryDirectory() as directory:
+            snapshot_file = os.path.join(directory, 'snapshot.pickle')
+            self.data_processor.save_snapshot(snapshot_file, files)
+            snapshot_processor = UserDataProcessor()
+            self.assertFalse(snapshot_processor.load_snapshot(snapshot_file, files[:1]), 'Snapshot loaded for different files')
+            self.assertTrue(snapshot_processor.load_snapshot(snapshot_file, files), 'Snapshot not loaded for unchanged files')
+        self.assertEqual(snapshot_processor.users, self.data_processor.users, 'Snapshot data is not appropriate')
+        output = snapshot_processor.authenticate_user('greenmadison@example.net', '&S1XUo94)k')
+        self.assertEqual(output.firstname, 'Kevin', 'Snapshot data is not indexed')
+
+    def process_files(self, files):
+        data_processor = UserDataProcessor()
+        data_processor.import_data(files)
+        data_processor.validate_emails()
+        data_processor.validate_telephone()
+        data_processor.remove_duplicates()
+        return data_processor.users
+
+    def test_31_import_data_incremental(self):
+        print('\nIncremental import - only changed files are imported again')
+        with tempfile.TemporaryDirectory() as directory:
+            files = []
+            for file in ['../data/a/c/users_2.csv', '../data/a/b/users_1.csv', '../data/a/users.json', '../data/a/b/users_1.xml']:
+                files.append(os.path.join(directory, str(len(files)) + os.path.basename(file)))
+                shutil.copy(file, files[-1])
+
+            changed_files = self.data_processor.import_data_incremental(files)
+            self.assertEqual(changed_files, files, 'All files should be imported first')
+            self.assertEqual(self.data_processor.users, self.process_files(files), 'Incremental import is not appropriate')
+
+            # Drop some users and make a duplicate newer
+            with open(files[0]) as f:
+                lines = f.readlines()
+            lines = lines[:1] + lines[4:]
+            lines[-5] = lines[-5].replace('2023-01-14 22:11:15', '2023-01-14 22:11:10')
+            with open(files[0], 'w') as f:
+                f.writelines(lines)
+            changed_files = self.data_processor.import_data_incremental(files)
+            self.assertEqual(changed_files, files[:1], 'Only the modified file should be imported again')
+            self.assertEqual(self.data_processor.users, self.process_files(files), 'Incremental import of modified file is not appropriate')
+
+            files = [files[3], files[0], files[1]]
+            self.data_processor.import_data_incremental(files)
+            self.assertEqual(self.data_processor.users, self.process_files(files), 'Incremental import of removed file is not appropriate')
+            output = self.data_processor.authenticate_user('greenmadison@example.net', '&S1XUo94)k')
+            self.assertEqual(output.firstname, 'Kevin', 'Incremental import does not index logins')
+
+    def test_32_sync_database(self):
+        print('\nSynchronizing database')
+        self.data_processor.import_data({'../data/a/c/users_2.csv'})
+        self.data_processor.validate_emails()
+        self.data_processor.validate_telephone()
+        self.data_processor.remove_duplicates()
+        with tempfile.TemporaryDirectory() as directory:
+            database_file = os.path.join(directory, 'users_database.db')
+            captured_output = StringIO()
+            sys.stdout = captured_output
+            self.data_processor.create_database('greenmadison@example.net', '&S1XUo94)k', database_file=database_file)
+            conn = sqlite3.connect(database_file)
+            ids = dict(conn.execute('SELECT email, id FROM users'))
+            conn.close()
+
+            # Remove a user, change children of another one and add a new one
+            users = self.data_processor.users
+            del users[0]
+            users[1].children = users[1].children[:1]
+            users.append(User.from_row('Anna', '123456789', 'anna@example.com', 'x', 'user', '2023-01-01 00:00:00', [('Ola', 3)]))
+            self.data_processor.create_database('greenmadison@example.net', '&S1XUo94)k', sync=True, database_file=database_file)
+            printed_value = captured_output.getvalue().strip()
+            sys.stdout = sys.__stdout__
+            self.assertEqual(printed_value, 'Database created successfully.\nDatabase synchronized successfully.', 'Synchronizing database is wrong')
+
+            db_processor = UserDataProcessor()
+            db_processor._load_db(database_file)
+            key = lambda user: user.email
+            self.assertEqual(sorted(db_processor.users, key=key), sorted(users, key=key), 'Synchronized database data is not appropriate')
+            conn = sqlite3.connect(database_file)
+            self.assertEqual(conn.execute('SELECT id FROM users WHERE email = ?', (users[2].email,)).fetchone()[0], ids[users[2].email], 'Unchanged user was rewritten')
+            indexes = [row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'index' ORDER BY name")]
+            conn.close()
+            self.assertEqual(indexes, ['children_age', 'children_parent_email', 'users_created_at', 'users_email', 'users_telephone_number'], 'Database indexes are missing')
+
+    def capture_commands(self, data_processor, logins):
+        captured_output = StringIO()
+        sys.stdout = captured_output
+        for login, password in logins:
+            data_processor.print_all_accounts(login, password)
+            data_processor.print_oldest_account(login, password)
+            data_processor.group_by_age(login, password)
+            data_processor.print_children(login, password)
+            data_processor.find_similar_children_by_age(login, password)
+        sys.stdout = sys.__stdout__
+        return captured_output.getvalue()
+
+    def test_33_sqlite_query_mode(self):
+        print('\nSQL query mode - same results as loaded database')
+        logins = [
+            ('jwilliams@example.com', '4^8(Oj52C+'),
+            ('817730653', '4^8(Oj52C+'),
+            ('jwilliams@example.com', 'wrong'),
+            ('nobody@example.com', 'wrong'),
+        ]
+        self.data_processor._load_db('../users_database.db')
+        logins += [(user.email, user.password) for user in self.data_processor.users[1:6]]
+        expected = self.capture_commands(self.data_processor, logins)
+        with tempfile.TemporaryDirectory() as directory:
+            database_file = os.path.join(directory, 'users_database.db')
+            shutil.copy('../users_database.db', database_file)
+            sqlite_processor = SQLiteUserDataProcessor(database_file)
+            output = self.capture_commands(sqlite_processor, logins)
+            sqlite_processor.close()
+        self.assertEqual(output, expected, 'SQL query mode results are not appropriate')
+        self.assertEqual(sqlite_processor.users, [], 'SQL query mode loaded users data')
+
+    def test_34_validate_users(self):
+        print('\nFused validation - rejection report')
+        files = sorted(self.test_files)
+        self.data_processor.import_data(files)
+        self.data_processor.validate_emails()
+        self.data_processor.validate_telephone()
+        fused_processor = UserDataProcessor()
+        fused_processor.import_data(files)
+        fused_processor.validate_users()
+        self.assertEqual(fused_processor.users, self.data_processor.users, 'Fused validation differs from separate validations')
+        loader_processor = UserDataProcessor()
+        loader_processor.import_data(files, validate=True)
+        self.assertEqual(loader_processor.users, self.data_processor.users, 'Validation while loading differs from separate validations')
+
+        self.assertEqual(fused_processor.rejections, {'invalid_email': 4, 'missing_telephone': 2}, 'Rejections are counted wrongly')
+        self.assertEqual(fused_processor.rejections, self.data_processor.rejections, 'Rejections are counted wrongly')
+        with tempfile.TemporaryDirectory() as directory:
+            report_file = os.path.join(directory, 'report.json')
+            fused_processor.write_rejection_report(report_file)
+            with open(report_file) as f:
+                report = json.load(f)
+        self.assertEqual(report['rejected'], 6, 'Rejection report is wrong')
+        self.assertEqual(len(report['samples']['invalid_email']), 4, 'Rejection report samples are wrong')
+        self.assertEqual(report['samples']['missing_telephone'][0][0], 'Arthur', 'Rejection report samples are wrong')
+
+    def test_35_server(self):
+        print('\nServer - commands sent over Unix socket')
+        self.data_processor.import_data({'../data/a/c/users_2.csv'})
+        self.data_processor.validate_users()
+        self.data_processor.remove_duplicates()
+        logins = [('greenmadison@example.net', '&S1XUo94)k'), ('tamara37@example.com', 'jQ66IIlR*1'), ('tamara37@example.com', 'wrong')]
+        expected = self.capture_commands(self.data_processor, logins)
+
+        reloads = []
+        with tempfile.TemporaryDirectory() as directory:
+            socket_path = os.path.join(directory, 'test.sock')
+            server = UserDataServer(self.data_processor, socket_path, reload=lambda: reloads.append(True), reload_interval=0.01)
+            thread = threading.Thread(target=server.run)
+            thread.start()
+            try:
+                while not os.path.exists(socket_path):
+                    time.sleep(0.01)
+                output = ''
+                for login, password in logins:
+                    for command in ['print-all-accounts', 'print-oldest-account', 'group-by-age', 'print-children', 'find-similar-children-by-age']:
+                        output += send_command(socket_path, command, login, password)
+                invalid_output = send_command(socket_path, 'unknown', *logins[0])
+                time.sleep(0.05)
+            finally:
+                server.stop()
+                thread.join()
+            self.assertFalse(os.path.exists(socket_path), 'Server socket was not removed')
+        self.assertEqual(output, expected, 'Server output is not appropriate')
+        self.assertEqual(invalid_output, 'Invalid command\n', 'Server output is not appropriate')
+        self.assertTrue(reloads, 'Server did not reload data')
+
+    def test_36_batch(self):
+        print('\nBatch - NDJSON results of command lines')
+        self.data_processor.import_data({'../data/a/c/users_2.csv'})
+        self.data_processor.validate_users()
+        self.data_processor.remove_duplicates()
+        logins = [('greenmadison@example.net', '&S1XUo94)k'), ('tamara37@example.com', 'jQ66IIlR*1'), ('tamara37@example.com', 'wrong')]
+        commands = ['print-all-accounts', 'print-oldest-account', 'group-by-age', 'print-children', 'find-similar-children-by-age']
+        expected = self.capture_commands(self.data_processor, logins)
+
+        lines = [f'{command} {login} {password}\n' for login, password in logins for command in commands]
+        lines += ['\n', 'print-children tamara37@example.com\n']
+        out = StringIO()
+        run_batch(self.data_processor, lines, out)
+        results = [json.loads(line) for line in out.getvalue().splitlines()]
+
+        output = ''.join(''.join(line + '\n' for line in result['output']) for result in results[:-1])
+        self.assertEqual(output, expected, 'Batch output is not appropriate')
+        self.assertEqual([result['command'] for result in results[:-1]], commands * len(logins), 'Batch commands are not appropriate')
+        self.assertEqual(results[-1], {'line': 17, 'error': 'Expected: command login password'}, 'Malformed line is not reported')
+
+    def test_37_generator(self):
+        print('\nGenerator - synthetic data in every format')
+        generator = UserDataGenerator(seed=1, duplicate_rate=0.2, invalid_rate=0.1)
+        with tempfile.TemporaryDirectory() as directory:
+            files = [os.path.join(directory, f'users.{extension}') for extension in ['json', 'csv', 'xml', 'db']]
+            for file in files:
+                generator.write_file(file, 250)
+            self.data_processor.import_data(files)
+
+        self.assertEqual(len(self.data_processor.users), 1000, 'Generated users are not loaded')
+        self.data_processor.validate_users()
+        self.assertEqual(sum(self.data_processor.rejections.values()), generator.invalid, 'Invalid users are not rejected')
+        self.data_processor.remove_duplicates()
+        # A duplicate of a rejected user or of a user replaced by another duplicate is kept
+        self.assertLess(len(self.data_processor.users), 1000 - generator.invalid, 'Duplicated users are not removed')
+        self.assertGreaterEqual(len(self.data_processor.users), 1000 - generator.invalid - generator.duplicates, 'Too many users are removed')
+        self.assertEqual(self.data_processor.authenticate_user(ADMIN_LOGIN, ADMIN_PASSWORD).role, 'admin', 'Generated admin is not available')
+
+    def test_38_profile(self):
+        print('\nProfiling - wall time, CPU time, records and memory of every stage')
+        files = ['../data/a/b/users_1.csv', '../data/a/users.json']
+        self.data_processor.enable_profiling()
+        try:
+            self.data_processor.import_data(files, validate=True)
+            self.data_processor.remove_duplicates()
+            captured_output = StringIO()
+            sys.stdout = captured_output
+            self.data_processor.run_command('print-all-accounts', 'kimberlymartin@example.org', 'ns6REVen+g')
+            sys.stdout = sys.__stdout__
+        finally:
+            sys.stdout = sys.__stdout__
+            tracemalloc.stop()
+
+        summary = self.data_processor.profile_summary()
+        stages = {record['stage']: record for record in summary['stages']}
+        self.assertEqual(list(stages), ['load:' + file for file in files] + ['remove_duplicates', 'command:print-all-accounts'], 'Profiled stages are not appropriate')
+        self.assertEqual(stages['load:../data/a/b/users_1.csv']['records_in'], 16, 'Parsed records are not counted')
+        self.assertEqual(stages['load:../data/a/b/users_1.csv']['records_out'], 12, 'Valid records are not counted')
+        self.assertEqual(stages['remove_duplicates']['records_in'], 43, 'Deduplicated records are not counted')
+        self.assertEqual(stages['remove_duplicates']['records_out'], len(self.data_processor.users), 'Deduplicated records are not counted')
+        for record in summary['stages']:
+            self.assertGreaterEqual(record['wall_seconds'], 0, 'Wall time is not recorded')
+            self.assertGreaterEqual(record['cpu_seconds'], 0, 'CPU time is not recorded')
+            self.assertGreater(record['peak_memory_mb'], 0, 'Peak memory is not recorded')
+        self.assertEqual(summary['peak_memory_mb'], max(record['peak_memory_mb'] for record in summary['stages']), 'Peak memory is not summarized')
+
+    def test_39_find_files(self):
+        print('\nDiscovery - same order as os.walk, include and exclude patterns')
+        walked = [os.path.join(root, file) for root, dirs, files in os.walk('../data')
+                  for file in files if file.endswith(('.json', '.csv', '.xml', '.db'))]
+        self.assertEqual(find_files('../data'), walked, 'Data files are not appropriate')
+        self.assertEqual(find_files('../data', include=['a/*.csv']), ['../data/a/b/users_1.csv', '../data/a/c/users_2.csv'], 'Included files are not appropriate')
+        self.assertEqual(find_files('../data', exclude=['a/b', '*.xml']), ['../data/a/users.json', '../data/a/c/users_2.csv'], 'Excluded files are not appropriate')
+
+    def test_40_csv_byte_ranges(self):
+        print('\nCSV byte ranges - parallel parsing of one large file')
+        with tempfile.TemporaryDirectory() as directory:
+            file = os.path.join(directory, 'users.csv')
+            UserDataGenerator(seed=2).write_csv(file, 500)
+            quoted_file = os.path.join(directory, 'quoted.csv')
+            with open(file) as source, open(quoted_file, 'w') as target:
+                target.write(source.read().replace('user7@', '"user7\n@"', 1))
+            files = [file, '../data/a/b/users_1.csv', quoted_file]
+
+            ranges = _csv_ranges(file, 2000)
+            self.assertGreater(len(ranges), 1, 'CSV file is not split')
+            self.assertEqual(ranges[-1][1], os.path.getsize(file), 'CSV ranges do not cover the file')
+            self.assertIsNone(_csv_ranges(quoted_file, 2000), 'CSV file with quotes is split')
+
+            self.data_processor.import_data(files)
+            parallel_data_processor = UserDataProcessor()
+            parallel_data_processor.csv_chunk_size = 2000
+            parallel_data_processor.import_data(files, workers=2)
+        self.assertEqual(parallel_data_processor.users, self.data_processor.users, 'Users data is not the same as after a serial import')
+
+    def test_41_xml_streaming(self):
+        print('\nXML streaming - same records with bounded memory')
+        for file in ['../data/users_2.xml', '../data/a/b/users_1.xml']:
+            parsed_users = [self.data_processor._xml_user(user) for user in ET.parse(file).getroot().findall('user')]
+            self.assertEqual(list(self.data_processor._iter_xml(file)), parsed_users, 'XML users are not appropriate')
+
+        with tempfile.TemporaryDirectory() as directory:
+            file = os.path.join(directory, 'users.xml')
+            UserDataGenerator(seed=3).write_xml(file, 5000)
+            tracemalloc.start()
+            try:
+                count = sum(1 for user in self.data_processor._iter_xml(file))
+                peak = tracemalloc.get_traced_memory()[1]
+            finally:
+                tracemalloc.stop()
+            self.assertEqual(count, 5000, 'XML users are not loaded')
+            self.assertLess(peak, os.path.getsize(file) / 4, 'XML file is not parsed incrementally')
+
+    def test_42_sharded_database(self):
+        print('\nSharded database - partitioned writes, parallel loads, scattered queries')
+        self.data_processor.import_data(sorted(self.test_files), validate=True)
+        self.data_processor.remove_duplicates()
+        logins = [('jwilliams@example.com', '4^8(Oj52C+'), ('817730653', '4^8(Oj52C+'), ('nobody@example.com', 'wrong')]
+        logins += [(user.email, user.password) for user in self.data_processor.users[1:6]]
+        expected = self.capture_commands(self.data_processor, logins)
+
+        with tempfile.TemporaryDirectory() as directory:
+            self.assertEqual(self.data_processor._write_shards(directory, 3), [True, True, True], 'Shards are not written')
+            loaded_processor = UserDataProcessor()
+            loaded_processor.import_sharded_database(directory, workers=2)
+            self.assertEqual(loaded_processor.users, self.data_processor.users, 'Sharded database does not keep users order')
+
+            sharded_processor = ShardedSQLiteUserDataProcessor(directory)
+            output = self.capture_commands(sharded_processor, logins)
+            sharded_processor.close()
+            self.assertEqual(output, expected, 'Scattered query results are not appropriate')
+
+            self.data_processor.users[0].firstname = 'Changed'
+            written = self.data_processor._write_shards(directory, 3, sync=True)
+            self.assertEqual(written.count(True), 1, 'Sync rewrites unchanged shards')
+            self.data_processor._write_shards(directory, 2)
+            self.assertEqual(len(os.listdir(directory)), 2, 'Leftover shards are not removed')
+
+    def test_43_external_dedupe(self):
+        print('\nExternal dedupe - same winners with sort keys spilled to files')
+        with tempfile.TemporaryDirectory() as directory:
+            generator = UserDataGenerator(seed=5, duplicate_rate=0.4)
+            files = []
+            for extension in ['json', 'csv', 'xml', 'db']:
+                files.append(os.path.join(directory, f'users.{extension}'))
+                generator.write_file(files[-1], 300)
+            files += sorted(self.test_files)
+
+            self.data_processor.import_data(files)
+            self.data_processor.validate_emails()
+            self.data_processor.validate_telephone()
+            self.data_processor.remove_duplicates()
+
+            temp_dir = os.path.join(directory, 'temp')
+            os.mkdir(temp_dir)
+            external_processor = UserDataProcessor()
+            # Three keys per run, so runs are merged in several passes
+            external_processor.import_data_external(files, memory_budget=DEDUPE_KEY_SIZE * 3, temp_dir=temp_dir)
+            self.assertEqual(os.listdir(temp_dir), [], 'Temporary files are not removed')
+        self.assertEqual(external_processor.users, self.data_processor.users, 'External dedupe differs from remove_duplicates')
+        self.assertEqual(external_processor.rejections, self.data_processor.rejections, 'Rejections are counted wrongly')
+
+    def test_44_created_at_index(self):
+        print('\nCreated_at index - top-N, time window and signup counts, kept through dedupe')
+        with tempfile.TemporaryDirectory() as directory:
+            file = os.path.join(directory, 'users.json')
+            UserDataGenerator(seed=7, duplicate_rate=0.3).write_file(file, 2000)
+            self.data_processor.import_data([file])
+            # Built before validation and dedupe, then filtered by them
+            self.data_processor._get_created_at_index()
+            self.data_processor.validate_users()
+            self.data_processor.remove_duplicates()
+            filtered_index = self.data_processor._created_at_index
+            self.data_processor._created_at_index = None
+            self.assertEqual(filtered_index, self.data_processor._get_created_at_index(), 'Created_at index is not kept through dedupe')
+
+            users = sorted(self.data_processor.users, key=lambda user: user.created_at)
+            rows = [(user.firstname, user.email, user.created_at_text) for user in users]
+            self.assertEqual(self.data_processor._oldest_accounts(5), rows[:5], 'Oldest accounts are not appropriate')
+            self.assertEqual(self.data_processor._newest_accounts(5), rows[:-6:-1], 'Newest accounts are not appropriate')
+            window = [row for row in rows if '2022-03-01' <= row[2] < '2022-03-15 12:00:00']
+            self.assertEqual(self.data_processor._accounts_created_between(*map(parse_time_bound, ('2022-03-01', '2022-03-15 12:00:00'))), window, 'Time window accounts are not appropriate')
+            months = sorted(Counter(row[2][:7] for row in rows).items())
+            self.assertEqual(self.data_processor._signup_counts('month', None, None), months, 'Signup counts are not appropriate')
+
+            database_file = os.path.join(directory, 'users.db')
+            sys.stdout = StringIO()
+            self.data_processor.create_database(ADMIN_LOGIN, ADMIN_PASSWORD, database_file=database_file)
+            sys.stdout = sys.__stdout__
+            commands = [('print-oldest-accounts', {'count': 7}), ('print-newest-accounts', {'count': 7}),
+                        ('print-accounts-created', {'since': '2022-06-01', 'until': '2022-07-01'}),
+                        ('count-signups', {'period': 'day', 'since': '2023-01-01'})]
+            sqlite_processor = SQLiteUserDataProcessor(database_file)
+            for command, options in commands:
+                expected, output = StringIO(), StringIO()
+                sys.stdout = expected
+                self.data_processor.run_command(command, ADMIN_LOGIN, ADMIN_PASSWORD, **options)
+                sys.stdout = output
+                sqlite_processor.run_command(command, ADMIN_LOGIN, ADMIN_PASSWORD, **options)
+                sys.stdout = sys.__stdout__
+                self.assertTrue(expected.getvalue(), f'{command} prints nothing')
+                self.assertEqual(output.getvalue(), expected.getvalue(), f'{command} differs in SQL query mode')
+            sqlite_processor.close()
+
+    def test_45_similar_children_report(self):
+        print('\nSimilar children report - every parent joined within children age buckets')
+        self.data_processor.import_data(sorted(self.test_files), validate=True)
+        self.data_processor.remove_duplicates()
+        users = self.data_processor.users
+        for tolerance in (0, 2):
+            report = [json.loads(line) for line in self.data_processor._similar_children_report(tolerance)]
+            parents = [user for user in users if user.children]
+            self.assertEqual([parent['email'] for parent in report], [user.email for user in parents], 'Parents are not reported in order')
+            for parent, user in zip(report, parents):
+                expected = [other.email for other in users
+                            if any(abs(child.age - other_child.age) <= tolerance
+                                   for child in user.children for other_child in other.children)]
+                self.assertEqual(parent['similar'], expected, 'Similar parents are not appropriate')
+
+        # Tolerance 0 matches find_similar_children_by_age of the parent
+        user = users[0]
+        captured_output = StringIO()
+        sys.stdout = captured_output
+        self.data_processor.find_similar_children_by_age(user.email, user.password)
+        sys.stdout = sys.__stdout__
+        telephone_numbers = [line.split(', ')[1].split(':')[0] for line in captured_output.getvalue().splitlines()]
+        similar = json.loads(next(self.data_processor._similar_children_report()))['similar']
+        self.assertEqual([self.data_processor._login_index[email].telephone_number for email in similar], telephone_numbers, 'Report differs from find_similar_children_by_age')
+
+        with tempfile.TemporaryDirectory() as directory:
+            database_file = os.path.join(directory, 'users.db')
+            sys.stdout = StringIO()
+            self.data_processor.create_database('jwilliams@example.com', '4^8(Oj52C+', database_file=database_file)
+            sys.stdout = sys.__stdout__
+            sqlite_processor = SQLiteUserDataProcessor(database_file)
+            self.assertEqual(list(sqlite_processor._similar_children_report(1)), list(self.data_processor._similar_children_report(1)), 'Report differs in SQL query mode')
+            sqlite_processor.close()
+
+    def test_46_output_writer(self):
+        print('\nOutput writer - text, JSON and NDJSON results with limit and offset')
+        self.data_processor.import_data(sorted(self.test_files), validate=True)
+        self.data_processor.remove_duplicates()
+        login, password = 'jwilliams@example.com', '4^8(Oj52C+'
+        lines = self.capture_commands(self.data_processor, [(login, password)]).splitlines()
+
+        def run(command, **options):
+            stream = StringIO()
+            output = OutputWriter(stream, buffer_size=64, **options)
+            self.data_processor.run_command(command, login, password, output=output)
+            output.close()
+            return stream.getvalue()
+
+        text = ''.join(run(command) for command in ['print-all-accounts', 'print-oldest-account', 'group-by-age', 'print-children', 'find-similar-children-by-age'])
+        self.assertEqual(text.splitlines(), lines, 'Text output differs from printed output')
+
+        age_counts = [line.split(', ') for line in run('group-by-age').splitlines()]
+        expected = [{'age': int(age[5:]), 'count': int(count[7:])} for age, count in age_counts]
+        self.assertEqual(json.loads(run('group-by-age', output_format='json')), expected, 'JSON output is not appropriate')
+        self.assertEqual([json.loads(line) for line in run('group-by-age', output_format='ndjson').splitlines()], expected, 'NDJSON output is not appropriate')
+        self.assertEqual(json.loads(run('print-children', output_format='json', limit=0)), [], 'Empty JSON output is not appropriate')
+        self.assertEqual(run('find-similar-children-by-age', offset=1, limit=2).splitlines(), run('find-similar-children-by-age').splitlines()[1:3], 'Limit and offset are not appropriate')
+        stream = StringIO()
+        output = OutputWriter(stream, 'json')
+        self.data_processor.run_command('print-children', 'nobody@example.com', password, output=output)
+        output.close()
+        self.assertEqual(json.loads(stream.getvalue()), [{'error': 'Your login is wrong'}], 'Errors are not written as JSON')
+
+        # Errors are written whatever the limit and offset
+        for options in ({'offset': 1}, {'limit': 0}, {'output_format': 'json', 'offset': 1}):
+            stream = StringIO()
+            output = OutputWriter(stream, **options)
+            self.data_processor.run_command('print-children', login, 'wrong', output=output)
+            output.close()
+            self.assertIn('Your password is wrong', stream.getvalue(), f'Error is lost with {options}')
+
+        class ClosedPipe:
+            def write(self, text):
+                raise BrokenPipeError()
+
+        output = OutputWriter(ClosedPipe(), buffer_size=1)
+        self.assertFalse(output.write('line'), 'Writing continues after the pipe is closed')
+        self.assertTrue(output.closed, 'Closed pipe is not detected')
+
+    def test_47_unparseable_created_at(self):
+        print('\nUnparseable created_at - rows reach validation instead of stopping the import')
+        with tempfile.TemporaryDirectory() as directory:
+            file = os.path.join(directory, 'users.csv')
+            with open(file, 'w') as f:
+                f.write('firstname;telephone_number;email;password;role;created_at;children\n')
+                f.write('Ann;123456789;ann@example.com;secret;admin;2023-01-01 10:00:00;\n')
+                f.write('Bob;987654321;not-an-email;secret;user;;\n')
+                f.write('Cid;555555555;ann@example.com;secret;user;yesterday;\n')
+            self.data_processor.import_data([file])
+        self.data_processor.validate_emails()
+        self.data_processor.validate_telephone()
+        self.data_processor.remove_duplicates()
+        self.assertEqual(self.data_processor.rejections['invalid_email'], 1, 'Row with unparseable created_at is not validated')
+        # A missing created_at never wins a duplicate against a date
+        self.assertEqual([user.firstname for user in self.data_processor.users], ['Ann'], 'Duplicate with unparseable created_at wins')
+
+        captured_output = StringIO()
+        sys.stdout = captured_output
+        self.data_processor.print_all_accounts('ann@example.com', 'secret')
+        sys.stdout = sys.__stdout__
+        self.assertEqual(captured_output.getvalue(), '1\n', 'Import is stopped by unparseable created_at')
+
+    def test_48_oldest_account_without_created_at(self):
+        print('\nOldest account - users without created_at are skipped in SQL query mode')
+        with tempfile.TemporaryDirectory() as directory:
+            database_file = os.path.join(directory, 'users.db')
+            shutil.copy('../users_database.db', database_file)
+            conn = sqlite3.connect(database_file)
+            conn.execute("INSERT INTO users (firstname, telephone_number, email, password, role, created_at) VALUES ('Nul', '111222333', 'nul@example.com', 'x', 'user', NULL)")
+            conn.commit()
+            conn.close()
+            self.data_processor.import_data([database_file])
+            login = ('jwilliams@example.com', '4^8(Oj52C+')
+            expected = self.capture_commands(self.data_processor, [login])
+
+            sqlite_processor = SQLiteUserDataProcessor(database_file)
+            output = self.capture_commands(sqlite_processor, [login])
+            sqlite_processor.conn.execute('DELETE FROM users WHERE created_at IS NOT NULL')
+            sqlite_processor.conn.execute("UPDATE users SET role = 'admin'")
+            captured_output = StringIO()
+            sys.stdout = captured_output
+            sqlite_processor.print_oldest_account('nul@example.com', 'x')
+            sys.stdout = sys.__stdout__
+            sqlite_processor.close()
+        self.assertEqual(output, expected, 'User without created_at is reported as the oldest account')
+        self.assertEqual(captured_output.getvalue().splitlines()[-1], 'No accounts with a creation date.', 'No oldest account is not reported')
+
+        with tempfile.TemporaryDirectory() as directory:
+            self.data_processor._write_shards(directory, 3)
+            sharded_processor = ShardedSQLiteUserDataProcessor(directory)
+            output = self.capture_commands(sharded_processor, [login])
+            for conn in sharded_processor.conns:
+                conn.execute('DELETE FROM users WHERE created_at IS NOT NULL')
+                conn.execute("UPDATE users SET role = 'admin'")
+            captured_output = StringIO()
+            sys.stdout = captured_output
+            sharded_processor.print_oldest_account('nul@example.com', 'x')
+            sys.stdout = sys.__stdout__
+            sharded_processor.close()
+        self.assertEqual(output, expected, 'User without created_at is reported as the oldest shard account')
+        self.assertEqual(captured_output.getvalue(), 'No accounts with a creation date.\n', 'No oldest shard account is not reported')
+
+    def test_49_signed_snapshot(self):
+        print('\nSnapshot - not unpickled unless signed with its key')
+        files = ['../data/a/c/users_2.csv']
+        self.data_processor.import_data(files)
+        UNPICKLED.clear()
+
+        with tempfile.TemporaryDirectory() as directory:
+            snapshot_file = os.path.join(directory, 'snapshot.pickle')
+            self.data_processor.save_snapshot(snapshot_file, files)
+            self.assertEqual(os.stat(snapshot_file + '.key').st_mode & 0o777, 0o600, 'Snapshot key is readable by others')
+            with open(snapshot_file, 'rb') as f:
+                digest = f.read(32)
+            with open(snapshot_file, 'wb') as f:
+                f.write(digest + pickle.dumps(SnapshotPayload()))
+            sys.stdout = StringIO()
+            loaded = UserDataProcessor().load_snapshot(snapshot_file, files)
+            sys.stdout = sys.__stdout__
+            self.assertFalse(loaded, 'Snapshot with a wrong signature is loaded')
+            self.assertEqual(UNPICKLED, [], 'Snapshot with a wrong signature is unpickled')
+
+            os.remove(snapshot_file + '.key')
+            self.data_processor.save_snapshot(snapshot_file, files)
+            os.remove(snapshot_file + '.key')
+            self.assertFalse(UserDataProcessor().load_snapshot(snapshot_file, files), 'Snapshot without a key is loaded')
+
+    def test_50_server_reload(self):
+        print('\nServer reload - only changed files re-imported, empty data folder ignored')
+        args = argparse.Namespace(include=None, exclude=None, workers=1, no_cache=True)
+        with tempfile.TemporaryDirectory() as directory:
+            for file in ['a/c/users_2.csv', 'a/b/users_1.xml']:
+                shutil.copy(os.path.join('../data', file), directory)
+            files = find_files(directory)
+            self.data_processor.import_data_stream(files)
+            expected = sorted(user.email for user in self.data_processor.users)
+
+            reload = data_reloader(self.data_processor, args, directory)
+            self.assertTrue(self.data_processor.incremental, 'Per file state is not seeded')
+            self.assertEqual(sorted(user.email for user in self.data_processor.users), expected, 'Seeding changed users data')
+            self.assertEqual(asyncio.run(reload()), [], 'Unchanged files are re-imported')
+
+            with open(files[0], 'a') as f:
+                f.write('\n')
+            os.utime(files[0], (0, 0))
+            self.assertEqual(asyncio.run(reload()), [files[0]], 'Only the changed file is re-imported')
+
+            for file in files:
+                os.remove(file)
+            sys.stdout = StringIO()
+            changed_files = asyncio.run(reload())
+            sys.stdout = sys.__stdout__
+            self.assertEqual(changed_files, [], 'Empty data folder is re-imported')
+            self.assertEqual(sorted(user.email for user in self.data_processor.users), expected, 'Empty data folder retracted users')
+
+    def test_51_created_at_formats(self):
+        print('\ncreated_at - same values accepted and rejected as by strptime')
+        for created_at in ['2023-01-05 10:00:00', '2023-1-5 10:00:00', '2023-01-05 9:05:00']:
+            expected = int((datetime.strptime(created_at, CREATED_AT_FORMAT) - datetime(1970, 1, 1)).total_seconds())
+            self.assertEqual(parse_created_at(created_at), expected, f'{created_at} is not parsed as by strptime')
+            user = User.from_row('Ann', '123456789', 'ann@example.com', 'secret', 'user', created_at)
+            self.assertEqual(user.created_at, expected, f'{created_at} is lost')
+        for created_at in ['2023-W01-1 10:00:00', '2023-01-05T10:00:00']:
+            with self.assertRaises(ValueError, msg=f'{created_at} is accepted'):
+                parse_created_at(created_at)
+
+    def test_52_parse_children(self):
+        print('\nCSV children field - same children as splitting every item on spaces')
+        fields = {
+            '': [],
+            'Michael (12),Theresa (6),,Judith (1),': [('Michael', 12), ('Theresa', 6), ('Judith', 1)],
+            'A(b (5)': [('A(b', 5)],
+            'Ann (5) (6)': [('Ann', 5)],
+            'Ann ((7))': [('Ann', 7)],
+            'Ann 8': [('Ann', 8)]
+        }
+        for field, children in fields.items():
+            self.assertEqual(_parse_children(field), children, f'Children of {field!r} are not appropriate')
+        for field in ['Mary Ann (5)', ' Ann (5)', 'Ann (²)', 'Ann']:
+            with self.assertRaises((ValueError, IndexError), msg=f'Children of {field!r} are accepted'):
+                _parse_children(field)
+
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file